@@ -0,0 +1,101 @@
+"""
+Бенчмарк загрузки датасета на больших объемах.
+
+Собирает синтетический CSV из строк data/ds_salaries.csv, повторенных до
+заданного числа строк, и сравнивает чтение по умолчанию (pd.read_csv
+целиком, как до типизированного загрузчика) с read_encoded_frame: время
+загрузки и память DataFrame. При установленном pyarrow дополнительно
+замеряет чтение того же набора из Parquet. Затем сравнивает построение
+статистики для матрицы корреляций с нуля и ее обновление после дописывания
+строк в конец CSV.
+
+Запуск из корня репозитория:
+    python bench/dataset.py [--rows 2000000] [--chunk-rows 500000] [--append-rows 1000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import pandas as pd  # noqa: E402
+
+from dataset import MAPPING_DICTS, frame_moments, get_statistics, read_encoded_frame  # noqa: E402
+from settings import settings  # noqa: E402
+
+
+def read_default(path: str) -> pd.DataFrame:
+    """
+    Чтение с типами по умолчанию: все столбцы, object-строки, int64/float64.
+    """
+    df = pd.read_csv(path, sep=',')
+    df = df.drop(["salary", "salary_currency"], axis=1)
+    for col, mapping in MAPPING_DICTS.items():
+        df[col] = df[col].map(mapping)
+    return df
+
+
+def measure(name: str, func, *args) -> pd.DataFrame:
+    started = time.perf_counter()
+    frame = func(*args)
+    elapsed = time.perf_counter() - started
+    memory = frame.memory_usage(deep=True).sum()
+    print(f"  {name:<28}{elapsed:>8.2f} s{memory / 2 ** 20:>10.1f} MiB")
+    return frame
+
+
+def measure_statistics(name: str, path: str):
+    get_statistics.cache_clear()
+    started = time.perf_counter()
+    moments = get_statistics(path).moments
+    print(f"  {name:<28}{time.perf_counter() - started:>8.2f} s")
+    return moments
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2_000_000, help="строк в синтетическом датасете")
+    parser.add_argument('--chunk-rows', type=int, default=settings.DATASET_CHUNK_ROWS, help="размер части")
+    parser.add_argument('--append-rows', type=int, default=1000, help="строк, дописываемых в конец CSV")
+    args = parser.parse_args()
+
+    source = pd.read_csv(os.path.join(ROOT, settings.DATASET_PATH))
+    repeats = -(-args.rows // len(source))
+    large = pd.concat([source] * repeats, ignore_index=True).iloc[:args.rows]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'salaries.csv')
+        large.to_csv(csv_path, index=False)
+        print(f"{len(large)} rows, CSV {os.path.getsize(csv_path) / 2 ** 20:.1f} MiB")
+
+        default = measure('read_csv (default dtypes)', read_default, csv_path)
+        typed = measure('read_encoded_frame', read_encoded_frame, csv_path, 0)
+        measure(f'read_encoded_frame ({args.chunk_rows})', read_encoded_frame, csv_path, args.chunk_rows)
+
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("  parquet: pyarrow не установлен, пропуск")
+        else:
+            parquet_path = os.path.join(tmp, 'salaries.parquet')
+            large.to_parquet(parquet_path, index=False)
+            measure('read_encoded_frame (parquet)', read_encoded_frame, parquet_path, 0)
+
+        same = default.corr(numeric_only=True).round(2).equals(typed.corr(numeric_only=True).round(2))
+        print(f"correlation matrix identical: {same}")
+
+        settings.DATASET_CACHE_DIR = tmp
+        measure_statistics('statistics (full)', csv_path)
+        with open(csv_path, 'a') as f:
+            source.iloc[:args.append_rows].to_csv(f, index=False, header=False)
+        moments = measure_statistics(f'statistics (+{args.append_rows} rows)', csv_path)
+        expected = frame_moments(read_encoded_frame(csv_path, args.chunk_rows))
+        print(f"incremental statistics match: {moments.count == len(large) + args.append_rows} "
+              f"{bool(abs(moments.comoment - expected.comoment).max() <= 1e-6 * abs(expected.comoment).max())}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Бенчмарк: время, пробуждения цикла событий и переходы в executor на один отчет.
+
+Сравнивает текущее дерево с ревизией git (по умолчанию — первый коммит).
+Каждая версия запускается в отдельном процессе внутри своего дерева;
+отчеты генерируются в этом же процессе, без пула процессов, чтобы
+учитывались все переходы между циклом событий и потоками.
+
+Запуск из корня репозитория:
+    python bench/loop_wakeups.py [--rev REV] [-n N]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Код замера, выполняемый внутри проверяемого дерева
+MEASURE = r'''
+import asyncio, json, sys, time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, 'src')
+import backend
+
+
+class CountingLoop(asyncio.SelectorEventLoop):
+    wakeups = 0
+    hops = 0
+
+    def _run_once(self):
+        CountingLoop.wakeups += 1
+        super()._run_once()
+
+    def run_in_executor(self, executor, func, *args):
+        CountingLoop.hops += 1
+        return super().run_in_executor(executor, func, *args)
+
+
+executor = ThreadPoolExecutor(max_workers=1)
+
+
+async def one_report():
+    if hasattr(backend, 'build_project'):
+        return await backend.build_project()
+    if hasattr(backend, 'render_project'):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, backend.render_project)
+    # Исходная версия: пайплайн выполняется прямо в цикле событий
+    return await backend.get_filepath_project()
+
+
+async def main(count):
+    await one_report()
+    CountingLoop.wakeups = CountingLoop.hops = 0
+    started = time.perf_counter()
+    for _ in range(count):
+        await one_report()
+    return {
+        'wall_ms': (time.perf_counter() - started) * 1000 / count,
+        'wakeups': CountingLoop.wakeups / count,
+        'executor_hops': CountingLoop.hops / count,
+    }
+
+
+loop = CountingLoop()
+print(json.dumps(loop.run_until_complete(main(int(sys.argv[1])))))
+'''
+
+
+def measure(tree: str, count: int) -> dict:
+    """
+    Запускает замер в дереве tree и возвращает средние значения на отчет.
+    """
+    output = subprocess.run(
+        [sys.executable, '-c', MEASURE, str(count)],
+        cwd=tree,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def export_revision(rev: str, target: str) -> None:
+    """
+    Выгружает src/ и data/ ревизии rev в каталог target.
+    """
+    archive = subprocess.run(
+        ['git', 'archive', rev, 'src', 'data'],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+    ).stdout
+    subprocess.run(['tar', '-x', '-C', target], input=archive, check=True)
+    if os.path.exists(os.path.join(ROOT, '.env')):
+        shutil.copy(os.path.join(ROOT, '.env'), target)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rev', help="ревизия для сравнения (по умолчанию первый коммит)")
+    parser.add_argument('-n', type=int, default=10, help="число отчетов на замер")
+    args = parser.parse_args()
+
+    rev = args.rev or subprocess.run(
+        ['git', 'rev-list', '--max-parents=0', 'HEAD'],
+        cwd=ROOT, check=True, capture_output=True, text=True,
+    ).stdout.split()[0]
+
+    with tempfile.TemporaryDirectory() as tree:
+        export_revision(rev, tree)
+        before = measure(tree, args.n)
+    after = measure(ROOT, args.n)
+
+    print(f"{'':<16}{rev[:10]:>12}{'current':>12}")
+    for key in ('wall_ms', 'wakeups', 'executor_hops'):
+        print(f"{key:<16}{before[key]:>12.1f}{after[key]:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
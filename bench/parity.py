@@ -0,0 +1,95 @@
+"""
+Проверка паритета движков моделей с sklearn.
+
+Для каждой пары (test_size, random_state) из пространства
+initialize_random_parameters сравнивает размеры выборок, строки RMSE/R2
+и предсказания движка (fit_models_fast или fit_models_incremental)
+с fit_models. Код выхода 1 — есть расхождения.
+
+Быстрый движок должен совпадать точно. Инкрементальный решает нормальные
+уравнения вместо LinearRegression, поэтому RMSE линейной модели, которое
+выводится без округления, сравнивается с относительным допуском
+RMSE_RTOL (наблюдаемая разница — около 1e-14); остальные строки
+совпадают точно.
+
+Запуск из корня репозитория:
+    python bench/parity.py [--engine fast|incremental]
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from modeling import ENGINES, fit_models  # noqa: E402
+
+# Относительный допуск RMSE линейной модели по движкам
+RMSE_RTOL = {'fast': 0.0, 'incremental': 1e-9}
+
+
+def _rmse_equal(expected: str, actual: str, rtol: float) -> bool:
+    if not rtol:
+        return expected == actual
+    return math.isclose(float(expected.rsplit(' ', 1)[1]), float(actual.rsplit(' ', 1)[1]), rel_tol=rtol)
+
+
+def compare(reference, candidate, rtol: float = 0.0) -> list:
+    """
+    Возвращает список полей, в которых результаты различаются.
+    """
+    mismatches = []
+    if (reference.train_size, reference.test_size) != (candidate.train_size, candidate.test_size):
+        mismatches.append('sizes')
+    if not np.array_equal(reference.y_test, candidate.y_test):
+        mismatches.append('y_test')
+    for name in ('linear', 'knn'):
+        expected, actual = getattr(reference, name), getattr(candidate, name)
+        if not _rmse_equal(expected.rmse, actual.rmse, rtol if name == 'linear' else 0.0):
+            mismatches.append(f'{name}.rmse')
+        if expected.r2 != actual.r2:
+            mismatches.append(f'{name}.r2')
+        if not np.allclose(expected.y_pred, actual.y_pred, rtol=0, atol=1e-6):
+            mismatches.append(f'{name}.y_pred')
+    return mismatches
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--engine', choices=sorted(RMSE_RTOL), default='fast', help="проверяемый движок")
+    args = parser.parse_args()
+    engine = ENGINES[args.engine]
+
+    failures = 0
+    reference_time = candidate_time = 0.0
+    for percent in range(10, 36):
+        for random_state in range(0, 151):
+            test_size = percent / 100
+
+            started = time.perf_counter()
+            reference = fit_models(test_size, random_state)
+            reference_time += time.perf_counter() - started
+
+            started = time.perf_counter()
+            candidate = engine(test_size, random_state)
+            candidate_time += time.perf_counter() - started
+
+            mismatches = compare(reference, candidate, RMSE_RTOL[args.engine])
+            if mismatches:
+                failures += 1
+                print(f"test_size={test_size} random_state={random_state}: {', '.join(mismatches)}")
+
+    total = 26 * 151
+    print(f"pairs: {total}, mismatched: {failures}")
+    print(
+        f"sklearn: {reference_time * 1000 / total:.2f} ms/pair, "
+        f"{args.engine}: {candidate_time * 1000 / total:.2f} ms/pair"
+    )
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""
+Бенчмарк пайплайна генерации отчета: этапы, задержки, пропускная способность.
+
+Замеряет отдельно каждый этап (загрузка шаблона, чтение CSV, тепловая карта,
+разбиение, каждая модель, каждый график, подстановка, сохранение) без кэшей,
+полный отчет внутри процесса с кэшами, пропускную способность пула процессов
+при параллельности 1..N и пиковый RSS. Результат сохраняется в JSON, чтобы
+сравнивать прогоны между коммитами.
+
+Запуск из корня репозитория:
+    python bench/pipeline.py [-n 30] [--concurrency 4] [--no-cache] [--output bench_output.json]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """
+    p50/p95/p99 и среднее в миллисекундах.
+    """
+    import numpy as np
+
+    values = np.asarray(samples) * 1000
+    return {
+        'p50': float(np.percentile(values, 50)),
+        'p95': float(np.percentile(values, 95)),
+        'p99': float(np.percentile(values, 99)),
+        'mean': float(values.mean()),
+    }
+
+
+def timed(samples: Dict[str, List[float]], name: str, func: Callable, *args):
+    """
+    Вызывает func и добавляет длительность в samples[name].
+    """
+    started = time.perf_counter()
+    result = func(*args)
+    samples.setdefault(name, []).append(time.perf_counter() - started)
+    return result
+
+
+def bench_stages(count: int) -> Dict[str, Dict[str, float]]:
+    """
+    Время каждого этапа пайплайна без кэшей.
+    """
+    import backend
+    import modeling
+    from dataset import (
+        DATASET_PATH,
+        feature_matrix,
+        get_correlation_matrix,
+        get_statistics,
+        read_encoded_frame,
+        target_vector,
+    )
+    from render import render_heatmap_png, render_prediction_plot_png
+    from settings import settings
+    from sklearn.linear_model import LinearRegression
+    from sklearn.model_selection import train_test_split
+    from sklearn.neighbors import KNeighborsRegressor
+    from template import TEMPLATE_PATH, ReportTemplate
+
+    def fit_linear(X_train, y_train, X_test, y_test):
+        if settings.MODEL_ENGINE == 'incremental':
+            total = get_statistics(DATASET_PATH).moments.select(modeling.MODEL_COLUMNS)
+            return modeling._normal_equations_predict(total, X_test, y_test)
+        if settings.MODEL_ENGINE == 'fast':
+            return modeling._linear_predict(X_train, y_train, X_test)
+        return LinearRegression().fit(X_train, y_train).predict(X_test)
+
+    def fit_knn(X_train, y_train, X_test):
+        if settings.MODEL_ENGINE in ('fast', 'incremental'):
+            return modeling._knn_predict(X_train, y_train, X_test)
+        return KNeighborsRegressor().fit(X_train, y_train).predict(X_test)
+
+    samples: Dict[str, List[float]] = {}
+    for _ in range(count):
+        params = backend.initialize_random_parameters()
+
+        template = timed(samples, 'template_load', ReportTemplate, TEMPLATE_PATH)
+        doc = timed(samples, 'template_clone', template.new_document)
+        frame = timed(samples, 'csv_load', read_encoded_frame, DATASET_PATH)
+        # Как в новом процессе-воркере: статистика читается из DATASET_CACHE_DIR
+        get_statistics.cache_clear()
+        get_correlation_matrix.cache_clear()
+        corr_matrix = timed(samples, 'correlation', get_correlation_matrix, DATASET_PATH)
+        heatmap = timed(samples, 'heatmap', render_heatmap_png, corr_matrix, params['colour_map'])
+
+        features = feature_matrix(frame)
+        target = target_vector(frame)
+        X_train, X_test, y_train, y_test = timed(samples, 'split', lambda: train_test_split(
+            features, target, test_size=params['test_size'], random_state=params['random_state'],
+        ))
+        linear_pred = timed(samples, 'linear_regression', fit_linear, X_train, y_train, X_test, y_test)
+        knn_pred = timed(samples, 'knn_regression', fit_knn, X_train, y_train, X_test)
+        linear_plot = timed(samples, 'linear_plot', render_prediction_plot_png, y_test, linear_pred, "Linear Regression")
+        knn_plot = timed(samples, 'knn_plot', render_prediction_plot_png, y_test, knn_pred, "kNN")
+
+        texts = {'{{PROCENT}}': str(int(params['test_size'] * 100))}
+        images = {
+            '{{IMAGE1}}': io.BytesIO(heatmap),
+            '{{IMAGE2}}': io.BytesIO(linear_plot),
+            '{{IMAGE3}}': io.BytesIO(knn_plot),
+        }
+        timed(samples, 'fill', template.fill, doc, texts, images)
+        timed(samples, 'save', backend.save_final_document, doc)
+
+    return {name: percentiles(values) for name, values in samples.items()}
+
+
+def bench_report(count: int) -> Dict[str, float]:
+    """
+    Полный отчет внутри процесса (с кэшами, как в процессе-воркере).
+    """
+    import backend
+
+    backend.render_project()
+    samples: Dict[str, List[float]] = {}
+    for _ in range(count):
+        timed(samples, 'report', backend.render_project)
+    return percentiles(samples['report'])
+
+
+async def bench_throughput(concurrency: int, count: int) -> List[Dict[str, float]]:
+    """
+    Отчетов в секунду через пул процессов при параллельности 1..concurrency.
+    """
+    import backend
+    from workers import ReportPool
+
+    results = []
+    for workers in range(1, concurrency + 1):
+        pool = ReportPool(workers, count)
+        try:
+            # Прогрев: запуск процессов и загрузка данных в каждом из них
+            await asyncio.gather(*(pool.run(backend.render_project) for _ in range(workers)))
+            started = time.perf_counter()
+            await asyncio.gather(*(pool.run(backend.render_project) for _ in range(count)))
+            elapsed = time.perf_counter() - started
+        finally:
+            await pool.close()
+        results.append({
+            'concurrency': workers,
+            'reports': count,
+            'seconds': elapsed,
+            'reports_per_sec': count / elapsed,
+        })
+    return results
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    """
+    Пиковый RSS текущего процесса и процессов-воркеров в мегабайтах.
+    """
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    }
+
+
+def git_revision() -> str:
+    """
+    Текущая ревизия git (с пометкой о незакоммиченных изменениях).
+    """
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'],
+            cwd=ROOT, check=True, capture_output=True, text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-n', type=int, default=30, help="число отчетов на замер")
+    parser.add_argument('--concurrency', type=int, default=os.cpu_count() or 1,
+                        help="максимальное число процессов-воркеров")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="отключить кэши тепловых карт и результатов моделей")
+    parser.add_argument('--output', default='bench_output.json', help="файл для результатов JSON")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, os.path.join(ROOT, 'src'))
+    if args.no_cache:
+        # Переменные окружения наследуются процессами-воркерами
+        for name in ('HEATMAP_CACHE_SIZE', 'MODEL_CACHE_SIZE'):
+            os.environ[name] = '0'
+        for name in ('HEATMAP_CACHE_DIR', 'MODEL_CACHE_DIR'):
+            os.environ[name] = ''
+
+    from settings import settings
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'engine': settings.MODEL_ENGINE,
+        'cache': not args.no_cache,
+        'stages_ms': bench_stages(args.n),
+        'report_ms': bench_report(args.n),
+        'throughput': asyncio.run(bench_throughput(args.concurrency, args.n)),
+    }
+    report['peak_rss_mb'] = peak_rss_mb()
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    print(f"{'stage':<20}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, stats in {**report['stages_ms'], 'report': report['report_ms']}.items():
+        print(f"{name:<20}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['p99']:>10.1f}")
+    for row in report['throughput']:
+        print(f"concurrency {row['concurrency']}: {row['reports_per_sec']:.2f} reports/s")
+    print(f"peak RSS: {report['peak_rss_mb']['self']:.0f} MB (workers {report['peak_rss_mb']['children']:.0f} MB)")
+    print(f"saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
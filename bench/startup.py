@@ -0,0 +1,103 @@
+"""
+Проверка времени старта бота по `python -X importtime`.
+
+Импортирует точку входа (src/main.py) в отдельном процессе и разбирает
+вывод importtime. Проверка не проходит (код возврата 1), если процесс бота
+импортирует научный стек (numpy, pandas, matplotlib, seaborn, sklearn, scipy,
+python-docx) или время импорта без самого aiogram превышает бюджет.
+Время импорта aiogram зависит от машины и не зависит от кода бота,
+поэтому выводится отдельно и в бюджет не входит.
+
+Запуск из корня репозитория:
+    python bench/startup.py [--budget 1.0] [--top 10]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Пакеты, которые должны загружаться только в процессах-воркерах
+HEAVY_PACKAGES = ('numpy', 'pandas', 'matplotlib', 'seaborn', 'sklearn', 'scipy', 'docx')
+
+# Строка вывода: "import time: <self> | <cumulative> | <отступ><модуль>"
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+# Значения для обязательных настроек, если .env отсутствует
+DUMMY_ENV = {
+    'BOT_TOKEN': '123:dummy',
+    'PROVIDER_TOKEN': 'dummy',
+    'PRICE_RUB': '1',
+    'SUPPORT_LINK': 'https://t.me/dummy',
+}
+
+
+def import_times(module: str) -> List[Tuple[str, int, int]]:
+    """
+    Импортирует module с -X importtime.
+
+    Возвращает:
+        List[Tuple[str, int, int]]: (модуль, уровень вложенности, cumulative в мкс)
+    """
+    env = {**DUMMY_ENV, **os.environ}
+    output = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.join(ROOT, 'src'),
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+
+    result = []
+    for line in output.splitlines():
+        match = LINE.match(line)
+        if match:
+            _, cumulative, indent, name = match.groups()
+            result.append((name, len(indent) // 2, int(cumulative)))
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--module', default='main', help="модуль точки входа")
+    parser.add_argument('--budget', type=float, default=1.0, help="бюджет времени импорта без aiogram, с")
+    parser.add_argument('--top', type=int, default=10, help="сколько самых долгих импортов показать")
+    args = parser.parse_args()
+
+    # Первый запуск прогревает кэш байткода, замеряется второй
+    import_times(args.module)
+    times = import_times(args.module)
+
+    total = next((cumulative for name, level, cumulative in times if name == args.module and level == 0), 0)
+    framework = max((cumulative for name, _, cumulative in times if name == 'aiogram'), default=0)
+    own = total - framework
+    top_level: Dict[str, int] = {}
+    for name, level, cumulative in times:
+        if level <= 1:
+            top_level[name] = max(top_level.get(name, 0), cumulative)
+    heavy = sorted({
+        name.split('.')[0] for name, _, _ in times
+        if name.split('.')[0] in HEAVY_PACKAGES
+    })
+
+    print(f"import {args.module}: {total / 1e6:.3f} s, aiogram {framework / 1e6:.3f} s, "
+          f"own {own / 1e6:.3f} s (budget {args.budget:.3f} s)")
+    for name, cumulative in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:<32}{cumulative / 1e3:>10.1f} ms")
+
+    failed = False
+    if heavy:
+        print(f"FAIL: heavy packages imported at startup: {', '.join(heavy)}")
+        failed = True
+    if own > args.budget * 1e6:
+        print("FAIL: import time over budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,19 +3,23 @@
 
 Без аргумента — сгенерировать и отправить новый проект.
 С аргументом — отправить файл по указанному ID платежа (или сгенерировать и привязать, если отсутствует file_id).
+/proj_batch — пакетная выдача по списку ID платежей или по всем платежам без file_id.
 """
 
 from aiogram import Router, F
-from aiogram.types import Message, FSInputFile
+from aiogram.types import Message, BufferedInputFile
 from functools import lru_cache
 from typing import Set
-import os
+
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from settings import settings
-from payments import get_file_id_for_provider
-from user import send_project_file
-from models import async_session, Payment
-from backend import get_filepath_project
+from artifacts import artifact_store
+from payments import get_cached_file_id, get_payment
+from user import deliver_project_file
+from reports import get_project_document
+from batch import export_payments
+from workers import PRIORITY_BACKGROUND
 
 
 router_admin = Router()
@@ -41,8 +45,37 @@ def is_admin(user_id: int) -> bool:
     return user_id in get_admin_ids()
 
 
+@router_admin.message(F.text.startswith("/proj_batch"))
+async def admin_proj_batch(message: Message, session: AsyncSession) -> None:
+    """
+    /proj_batch [zip] <payment_id> [<payment_id> ...] | missing
+
+    - Список ID (через пробел или запятую): выдать отчеты по этим платежам
+    - missing: выдать отчеты по всем платежам без file_id
+    - zip: прислать zip-архивами вместо пакетов документов
+      (file_id к платежам при этом не привязываются)
+    """
+    if not is_admin(message.from_user.id):
+        return
+
+    args = message.text.replace(",", " ").split()[1:]
+    as_zip = bool(args) and args[0] == "zip"
+    if as_zip:
+        args = args[1:]
+
+    if args == ["missing"]:
+        provider_payment_ids = []
+    elif args and "missing" not in args:
+        provider_payment_ids = args
+    else:
+        await message.answer("Использование: /proj_batch [zip] <ID ...> или /proj_batch [zip] missing")
+        return
+
+    await export_payments(message, session, provider_payment_ids, as_zip=as_zip)
+
+
 @router_admin.message(F.text.startswith("/proj"))
-async def admin_proj(message: Message) -> None:
+async def admin_proj(message: Message, session: AsyncSession) -> None:
     """
     /proj [<payment_id>]
 
@@ -56,15 +89,13 @@ async def admin_proj(message: Message) -> None:
 
     # Случай: без аргумента — просто сгенерировать и отправить
     if len(parts) == 1:
+        document = await get_project_document(PRIORITY_BACKGROUND, owner=message.from_user.id)
         try:
-            file_path = await get_filepath_project()
-            docx = FSInputFile(file_path)
+            docx = BufferedInputFile(document, filename="proj.docx")
             await message.answer_document(docx, caption="Админ-генерация проекта")
         finally:
-            try:
-                os.remove(file_path)
-            except Exception:
-                pass
+            # Отчет не привязан к платежу: вариант остается невыданным
+            artifact_store.release(document)
         return
 
     # С аргументом — ожидаем provider_payment_id
@@ -73,25 +104,19 @@ async def admin_proj(message: Message) -> None:
         await message.answer("ID не валиден.")
         return
 
-    # Проверяем, что запись о платеже существует
-    async with async_session() as session:
-        result = await session.execute(
-            Payment.__table__.select()
-            .where(Payment.provider_payment_id == provider_payment_id)
-            .limit(1)
-        )
-        row = result.mappings().first()
-
-    if not row:
-        await message.answer("ID не найден или не валиден.")
-        return
+    # file_id из кэша означает, что платеж существует; иначе одна выборка:
+    # проверка существования платежа и его file_id
+    file_id = get_cached_file_id(provider_payment_id)
+    if not file_id:
+        row = await get_payment(session, provider_payment_id)
 
-    # Если file_id уже сохранен — отправляем его
-    file_id = await get_file_id_for_provider(provider_payment_id)
-    receipt_text = f"Админ-выдача по платежу\nID: {provider_payment_id}"
-    if file_id:
-        await message.answer_document(file_id, caption=receipt_text)
-        return
+        if not row:
+            await message.answer("ID не найден или не валиден.")
+            return
+        file_id = row["file_id"]
 
-    # Иначе генерируем проект, отправляем и привязываем file_id к платежу
-    await send_project_file(message, provider_payment_id=provider_payment_id, receipt_text=receipt_text)
\ No newline at end of file
+    # Отправляем сохраненный file_id, иначе генерируем проект и привязываем его к платежу
+    receipt_text = f"Админ-выдача по платежу\nID: {provider_payment_id}"
+    await deliver_project_file(
+        message, session, provider_payment_id, receipt_text, file_id, PRIORITY_BACKGROUND
+    )
\ No newline at end of file
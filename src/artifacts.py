@@ -0,0 +1,492 @@
+"""
+Хранилище готовых отчетов по вариантам параметров.
+
+Отчет полностью определяется вариантом (test_size, random_state, colour_map),
+поэтому готовый .docx сохраняется на диске под ключом варианта и повторно
+не рендерится. Генерация занимает еще не выданный вариант — сначала
+из сохраненных — и рендерит его только при промахе. Выданным вариант
+становится, когда отчет привязан к платежу (mark_used); до этого он занят
+только в памяти процесса и освобождается, если отчет не выдан (cancel,
+release), поэтому отчеты из запаса, потерянного при перезапуске,
+выдаются с диска, а не генерируются заново.
+
+Индекс хранится в каталоге рядом с файлами как журнал JSON-строк:
+записи только дописываются, а при открытии и разрастании журнал
+переписывается снимком текущего состояния (при разрастании — в потоке,
+не блокируя цикл событий). Хранилищем владеет один процесс бота; модуль
+не импортирует научный стек.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from settings import settings
+from telemetry import ARTIFACT_LOOKUP, Gauge
+
+
+logger = logging.getLogger(__name__)
+
+# Цветовые схемы тепловой карты корреляций
+COLOUR_MAPS = [
+    "viridis", "plasma", "inferno", "magma", "cividis", "spring",
+    "summer", "autumn", "winter", "cool", "Wistia", "hot",
+    "afmhot", "gist_heat", "copper"
+]
+
+# Доля тестовой выборки в процентах и seed разбиения
+TEST_PERCENTS = range(10, 36)
+RANDOM_STATES = range(0, 151)
+
+# Входные файлы отчета (датасет и TEMPLATE_PATH): при их изменении
+# сохраненные отчеты устаревают
+INPUT_FILES = (settings.DATASET_PATH, 'data/project.docx')
+
+# Имя файла индекса в каталоге хранилища
+INDEX_NAME = 'index.jsonl'
+
+# Вариант отчета: (test_size в процентах, random_state, colour_map)
+Variant = Tuple[int, int, str]
+
+
+def variant_name(variant: Variant) -> str:
+    """
+    Строковый ключ варианта: "<test_percent>-<random_state>-<colour_map>".
+    """
+    test_percent, random_state, colour_map = variant
+    return f"{test_percent}-{random_state}-{colour_map}"
+
+
+def parse_variant(name: str) -> Variant:
+    """
+    Вариант по строковому ключу.
+    """
+    test_percent, random_state, colour_map = name.split('-', 2)
+    return int(test_percent), int(random_state), colour_map
+
+
+def variant_params(variant: Variant) -> dict:
+    """
+    Параметры отчета для варианта.
+
+    Возвращает:
+        dict: test_size (доля), random_state и colour_map
+    """
+    test_percent, random_state, colour_map = variant
+    return {
+        'test_size': test_percent / 100,
+        'random_state': random_state,
+        'colour_map': colour_map,
+    }
+
+
+def random_variant() -> Variant:
+    """
+    Случайный вариант отчета.
+    """
+    return (
+        random.choice(TEST_PERCENTS),
+        random.choice(RANDOM_STATES),
+        random.choice(COLOUR_MAPS),
+    )
+
+
+def all_variants() -> Iterator[Variant]:
+    """
+    Все варианты отчета (около 59 тысяч).
+    """
+    for test_percent in TEST_PERCENTS:
+        for random_state in RANDOM_STATES:
+            for colour_map in COLOUR_MAPS:
+                yield test_percent, random_state, colour_map
+
+
+def inputs_key(paths: Tuple[str, ...] = INPUT_FILES) -> str:
+    """
+    Короткий ключ версии входных файлов по их путям, размерам и времени изменения.
+    """
+    parts = []
+    for path in paths:
+        stat = os.stat(path)
+        parts.append(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:16]
+
+
+class ArtifactStore:
+    """
+    Готовые отчеты на диске по вариантам с ограничением общего размера.
+
+    Атрибуты:
+        directory: Каталог хранилища (пусто — хранилище выключено)
+        max_bytes: Предельный размер файлов отчетов; при превышении
+            удаляются давно не использованные
+    """
+
+    # Переписывать журнал, когда в нем во столько раз больше строк, чем записей
+    COMPACT_RATIO = 4
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max(0, max_bytes)
+        self._opened = False
+        self._inputs = ""
+        # Сохраненные отчеты в порядке использования: имя варианта -> запись
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        # SHA-256 содержимого -> имя варианта
+        self._by_digest: Dict[str, str] = {}
+        # Варианты, привязанные к платежам
+        self._used: Set[str] = set()
+        # Варианты, занятые генерацией или запасом этого процесса (не сохраняются)
+        self._claimed: Set[str] = set()
+        self._size = 0
+        self._log = None
+        self._log_lines = 0
+        # Фоновое переписывание журнала и строки, дописанные за время него
+        self._compaction: Optional[asyncio.Task] = None
+        self._pending: List[str] = []
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory) and self.max_bytes > 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _path(self, name: str) -> str:
+        digest = hashlib.sha256(f"{self._inputs}:{name}".encode()).hexdigest()[:32]
+        return os.path.join(self.directory, f"{digest}.docx")
+
+    def _open(self) -> None:
+        """
+        Загружает индекс и приводит каталог в соответствие с ним.
+        """
+        if self._opened:
+            return
+        self._opened = True
+        os.makedirs(self.directory, exist_ok=True)
+        self._inputs = inputs_key()
+
+        index_path = os.path.join(self.directory, INDEX_NAME)
+        inputs = None
+        try:
+            with open(index_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Недописанная строка после аварийной остановки
+                        continue
+                    if 'inputs' in record:
+                        inputs = record['inputs']
+                    else:
+                        self._replay(record)
+        except OSError:
+            pass
+
+        # Входные файлы изменились: отчеты устарели, выданные варианты остаются
+        if inputs != self._inputs:
+            self._entries.clear()
+            self._by_digest.clear()
+
+        # Записи без файла и файлы без записи
+        for name in [name for name in self._entries if not os.path.exists(self._path(name))]:
+            self._drop(name)
+        known = {os.path.basename(self._path(name)) for name in self._entries}
+        for filename in os.listdir(self.directory):
+            if filename.endswith(('.docx', '.tmp')) and filename not in known:
+                self._remove_file(os.path.join(self.directory, filename))
+
+        self._size = sum(entry['size'] for entry in self._entries.values())
+        self._compact()
+        self._evict()
+
+    def _replay(self, record: Dict) -> None:
+        """
+        Применяет запись журнала к состоянию в памяти.
+        """
+        if 'put' in record:
+            name = record['put']
+            self._drop(name)
+            self._entries[name] = {'size': record['size'], 'sha256': record['sha256']}
+            self._entries.move_to_end(name)
+            self._by_digest[record['sha256']] = name
+        elif 'get' in record:
+            if record['get'] in self._entries:
+                self._entries.move_to_end(record['get'])
+        elif 'use' in record:
+            self._used.add(record['use'])
+        elif 'evict' in record:
+            self._drop(record['evict'])
+
+    def _drop(self, name: str) -> None:
+        entry = self._entries.pop(name, None)
+        if entry is not None:
+            self._by_digest.pop(entry['sha256'], None)
+            self._size -= entry['size']
+
+    def _remove_file(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _append(self, record: Dict) -> None:
+        """
+        Дописывает запись в журнал, при разрастании переписывает его снимком.
+        """
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        self._log.write(line)
+        self._log.flush()
+        self._log_lines += 1
+        if self._compaction is not None:
+            # Запись должна попасть и в переписываемый журнал
+            self._pending.append(line)
+            return
+        live = len(self._entries) + len(self._used)
+        if self._log_lines > self.COMPACT_RATIO * live + 1000:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                self._compact()
+                return
+            self._compaction = loop.create_task(self._compact_in_thread())
+
+    def _snapshot(self) -> List[str]:
+        """
+        Строки журнала, описывающие текущее состояние.
+        """
+        records = [{'inputs': self._inputs}]
+        for name, entry in self._entries.items():
+            records.append({'put': name, 'size': entry['size'], 'sha256': entry['sha256']})
+        records.extend({'use': name} for name in sorted(self._used))
+        return [json.dumps(record, ensure_ascii=False) + "\n" for record in records]
+
+    def _compact(self) -> None:
+        """
+        Переписывает журнал снимком текущего состояния (при открытии хранилища).
+        """
+        if self._log is not None:
+            self._log.close()
+        lines = self._snapshot()
+        index_path = os.path.join(self.directory, INDEX_NAME)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        _write_lines(tmp_path, lines)
+        os.replace(tmp_path, index_path)
+
+        self._log = open(index_path, 'a', encoding='utf-8')
+        self._log_lines = len(lines)
+
+    async def _compact_in_thread(self) -> None:
+        """
+        Переписывает журнал снимком, не блокируя цикл событий.
+
+        Снимок пишется во временный файл в потоке; записи, дописанные
+        за это время в старый журнал, добавляются к нему перед заменой.
+        """
+        log, lines = self._log, self._snapshot()
+        index_path = os.path.join(self.directory, INDEX_NAME)
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        try:
+            await asyncio.to_thread(_write_lines, tmp_path, lines)
+            if self._log is not log:
+                # Хранилище закрыто, пока писался снимок
+                self._remove_file(tmp_path)
+                return
+            with open(tmp_path, 'a', encoding='utf-8') as f:
+                f.writelines(self._pending)
+            os.replace(tmp_path, index_path)
+            self._log = open(index_path, 'a', encoding='utf-8')
+            self._log_lines = len(lines) + len(self._pending)
+            log.close()
+        except OSError:
+            logger.exception("Не удалось переписать журнал хранилища отчетов")
+            self._remove_file(tmp_path)
+        finally:
+            self._compaction = None
+            self._pending = []
+
+    def _evict(self) -> None:
+        """
+        Удаляет отчеты сверх max_bytes: сначала давно не использованные
+        из уже выданных, затем из невыданных. Занятые процессом не удаляются,
+        иначе их не удастся отметить выданными.
+        """
+        while self._size > self.max_bytes:
+            name = next((name for name in self._entries if name in self._used), None)
+            if name is None:
+                name = next((name for name in self._entries if name not in self._claimed), None)
+            if name is None:
+                break
+            self._remove_file(self._path(name))
+            self._drop(name)
+            self._append({'evict': name})
+
+    def _available(self, name: str) -> bool:
+        return name not in self._used and name not in self._claimed
+
+    def reserve(self) -> Variant:
+        """
+        Занимает еще не выданный вариант до конца работы процесса.
+
+        Сначала берутся сохраненные, но не выданные и не занятые варианты,
+        затем случайные из оставшихся. Когда выданы все варианты, повторно
+        используется сохраненный отчет (или случайный вариант). Выданным
+        вариант отмечает mark_used при привязке отчета к платежу.
+
+        Возвращает:
+            Variant: Вариант отчета
+        """
+        if not self.enabled:
+            return random_variant()
+        self._open()
+
+        name = next((name for name in self._entries if self._available(name)), None)
+        if name is None:
+            name = self._random_unused()
+        if name is None:
+            name = next(iter(self._entries), None) or variant_name(random_variant())
+
+        if name not in self._used:
+            self._claimed.add(name)
+        return parse_variant(name)
+
+    def _random_unused(self) -> Optional[str]:
+        """
+        Случайный невыданный и не занятый вариант или None, если таких нет.
+        """
+        for _ in range(32):
+            name = variant_name(random_variant())
+            if self._available(name):
+                return name
+        # Выдано большинство вариантов: выбор из оставшихся
+        remaining = [name for name in map(variant_name, all_variants()) if self._available(name)]
+        return random.choice(remaining) if remaining else None
+
+    async def get(self, variant: Variant) -> Optional[bytes]:
+        """
+        Возвращает сохраненный отчет варианта или None.
+        """
+        if not self.enabled:
+            return None
+        self._open()
+
+        name = variant_name(variant)
+        if name not in self._entries:
+            ARTIFACT_LOOKUP.inc(result="miss")
+            return None
+        try:
+            document = await asyncio.to_thread(_read_file, self._path(name))
+        except OSError:
+            ARTIFACT_LOOKUP.inc(result="miss")
+            self._drop(name)
+            self._append({'evict': name})
+            return None
+
+        ARTIFACT_LOOKUP.inc(result="hit")
+        self._entries.move_to_end(name)
+        self._append({'get': name})
+        return document
+
+    async def put(self, variant: Variant, document: bytes) -> None:
+        """
+        Сохраняет отчет варианта, вытесняя давно не использованные при переполнении.
+        """
+        if not self.enabled:
+            return
+        self._open()
+
+        name = variant_name(variant)
+        digest = hashlib.sha256(document).hexdigest()
+        try:
+            await asyncio.to_thread(_write_file, self._path(name), document)
+        except OSError:
+            logger.exception("Не удалось сохранить отчет %s", name)
+            return
+
+        self._drop(name)
+        self._entries[name] = {'size': len(document), 'sha256': digest}
+        self._by_digest[digest] = name
+        self._size += len(document)
+        self._append({'put': name, 'size': len(document), 'sha256': digest})
+        self._evict()
+
+    def mark_used(self, document: bytes) -> None:
+        """
+        Отмечает выданным вариант сохраненного отчета с таким содержимым.
+
+        Вызывается, когда отчет привязан к платежу: после этого вариант
+        не выбирается для новых отчетов и после перезапуска.
+        """
+        if not self._entries:
+            return
+        name = self._by_digest.get(hashlib.sha256(document).hexdigest())
+        if name is None:
+            return
+        self._claimed.discard(name)
+        if name not in self._used:
+            self._used.add(name)
+            self._append({'use': name})
+
+    def cancel(self, variant: Variant) -> None:
+        """
+        Освобождает вариант, занятый reserve, отчет по которому не получен
+        (ошибка или отмена генерации).
+        """
+        self._claimed.discard(variant_name(variant))
+
+    def release(self, document: bytes) -> None:
+        """
+        Освобождает вариант сохраненного отчета с таким содержимым, если отчет
+        не привязан к платежу: ошибка отправки или выдача администратору
+        без платежа. Вариант снова может быть выбран reserve.
+        """
+        name = self._by_digest.get(hashlib.sha256(document).hexdigest())
+        if name is not None:
+            self._claimed.discard(name)
+
+    def close(self) -> None:
+        """
+        Закрывает журнал индекса.
+        """
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        self._opened = False
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _write_lines(path: str, lines: List[str]) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+
+
+def _write_file(path: str, data: bytes) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+# Общее хранилище отчетов
+artifact_store = ArtifactStore(
+    settings.ARTIFACT_STORE_DIR,
+    settings.ARTIFACT_STORE_MAX_MB * 1024 * 1024,
+)
+
+Gauge(
+    'artifact_store_bytes',
+    "Размер отчетов в хранилище",
+    lambda: artifact_store.size,
+)
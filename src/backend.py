@@ -1,69 +1,104 @@
 """
-Генерация отчетного документа по данным (асинхронный пайплайн).
+Генерация отчетного документа по данным.
+
+Пайплайн синхронный и целиком выполняется в процессе-воркере пула
+report_pool: один отчет — одно задание, без переходов между потоками.
+Модуль импортируется только в процессах-воркерах; процесс бота ставит
+задания через reports.get_project_document.
 """
-import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import random
-import uuid
 import os
-from docx import Document
-from docx.shared import Inches
-from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LinearRegression
-from sklearn.neighbors import KNeighborsRegressor
-from sklearn import metrics
-import asyncio
-import functools
+import io
+from docx.document import Document
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from artifacts import Variant, random_variant, variant_params
+from cache import LRUCache
+from dataset import get_correlation_matrix, get_statistics
+from modeling import ModelingResults, get_modeling_results
+from render import render_heatmap_png, render_prediction_plot_png
+from settings import settings
+from telemetry import StageClock
+from template import get_template
 
-plt.switch_backend('Agg')
+# Кэш PNG тепловых карт в памяти процесса: colour_map -> bytes
+heatmap_cache = LRUCache(settings.HEATMAP_CACHE_SIZE)
 
-project_generation_semaphore = asyncio.Semaphore(1)
 
-async def get_filepath_project() -> str:
+def render_project_timed(variant: Optional[Variant] = None) -> Tuple[bytes, Dict[str, float]]:
     """
-    Основная функция для обработки данных, генерации визуализаций 
-    и создания итогового отчета в формате Word.
+    Точка входа процесса-воркера: отчет и длительности его этапов.
+    
+    Аргументы:
+        variant: Вариант отчета (по умолчанию случайный)
     
     Возвращает:
-        str: Путь к сохраненному файлу отчета
+        Tuple[bytes, Dict[str, float]]: Содержимое отчета и время этапов в секундах
     """
-    async with project_generation_semaphore:
-        # Инициализация документа и случайных параметров
-        doc = Document('data/project.docx')
-        random_params = await initialize_random_parameters()
-        
-        # Обновление шаблона документа
-        await update_document_template(doc, random_params)
-        
-        # Загрузка и предварительная обработка данных
-        df = await load_and_preprocess_data()
-        
-        # Генерация и вставка тепловой карты корреляций
-        await insert_correlation_heatmap(doc, df, random_params['colour_map'])
-        
-        # Подготовка данных для моделирования
-        X_train, X_test, y_train, y_test = await prepare_modeling_data(
-            df, 
-            random_params['test_size'], 
-            random_params['random_state']
-        )
-        
-        # Обновление информации о размерах выборок
-        await update_dataset_sizes(doc, X_train, X_test)
-        
-        # Линейная регрессия
-        await perform_linear_regression(doc, X_train, X_test, y_train, y_test)
-        
-        # Метод k-ближайших соседей
-        await perform_knn_regression(doc, X_train, X_test, y_train, y_test)
-        
-        # Сохранение и возврат итогового документа
-        return await save_final_document(doc)
+    clock = StageClock()
+    params = variant_params(variant) if variant is not None else None
+    return render_project(clock, params), clock.timings
 
 
-async def initialize_random_parameters() -> dict:
+def render_project(clock: Optional[StageClock] = None, params: Optional[dict] = None) -> bytes:
+    """
+    Пайплайн генерации отчета.
+    
+    Аргументы:
+        clock: Замер длительности этапов (необязательно)
+        params: test_size, random_state и colour_map (по умолчанию случайные)
+    
+    Возвращает:
+        bytes: Содержимое файла отчета (.docx)
+    """
+    if clock is None:
+        clock = StageClock()
+
+    # Инициализация документа и параметров отчета
+    template = get_template()
+    doc = template.new_document()
+    random_params = params if params is not None else initialize_random_parameters()
+    clock.mark('template')
+    
+    # Замены плейсхолдеров: текстовые и изображения
+    texts: Dict[str, str] = {}
+    images: Dict[str, BinaryIO] = {}
+    
+    # Обновление шаблона документа
+    update_document_template(texts, random_params)
+    
+    # Генерация тепловой карты корреляций
+    insert_correlation_heatmap(images, random_params['colour_map'])
+    clock.mark('heatmap')
+    
+    # Обучение моделей (или получение результатов из кэша)
+    results = prepare_modeling_data(
+        random_params['test_size'], 
+        random_params['random_state']
+    )
+    clock.mark('modeling')
+    
+    # Обновление информации о размерах выборок
+    update_dataset_sizes(texts, results.train_size, results.test_size)
+    
+    # Линейная регрессия
+    perform_linear_regression(texts, images, results)
+    clock.mark('linear_plot')
+    
+    # Метод k-ближайших соседей
+    perform_knn_regression(texts, images, results)
+    clock.mark('knn_plot')
+    
+    # Подстановка всех значений в документ за один проход
+    template.fill(doc, texts, images)
+    clock.mark('fill')
+    
+    # Сохранение и возврат итогового документа
+    document = save_final_document(doc)
+    clock.mark('save')
+    return document
+
+
+def initialize_random_parameters() -> dict:
     """
     Инициализация случайных параметров для анализа.
     
@@ -73,303 +108,160 @@ async def initialize_random_parameters() -> dict:
             - random_state: случайное seed-значение
             - colour_map: случайная цветовая схема для визуализаций
     """
-    loop = asyncio.get_running_loop()
-    test_size = await loop.run_in_executor(None, functools.partial(random.randint, 10, 35))
-    test_size /= 100
-    random_state = await loop.run_in_executor(None, functools.partial(random.randint, 0, 150))
-    colour_map = await loop.run_in_executor(None, functools.partial(random.choice, [
-        "viridis", "plasma", "inferno", "magma", "cividis", "spring",
-        "summer", "autumn", "winter", "cool", "Wistia", "hot",
-        "afmhot", "gist_heat", "copper"
-    ]))
-    return {
-        'test_size': test_size,
-        'random_state': random_state,
-        'colour_map': colour_map,
-    }
+    return variant_params(random_variant())
 
 
-async def update_document_template(doc: Document, params: dict) -> None:
+def update_document_template(texts: Dict[str, str], params: dict) -> None:
     """
-    Замена плейсхолдеров в шаблоне документа на реальные значения.
+    Подготовка замен плейсхолдеров шаблона на значения параметров.
     
     Аргументы:
-        doc: Объект документа Word
+        texts: Словарь замен плейсхолдеров, дополняется на месте
         params: Словарь с параметрами для замены
     """
-    loop = asyncio.get_running_loop()
-    for paragraph in doc.paragraphs:
-        if '{{PROCENT}}' in paragraph.text:
-            paragraph.text = await loop.run_in_executor(None, functools.partial(paragraph.text.replace,
-                '{{PROCENT}}', 
-                str(int(params['test_size'] * 100))))
-            
-        if '{{RANDOM_STATE}}' in paragraph.text:
-            paragraph.text = await loop.run_in_executor(None, functools.partial(paragraph.text.replace,
-                '{{RANDOM_STATE}}', 
-                str(params['random_state'])))
-            
-        if '{{COLOR}}' in paragraph.text:
-            paragraph.text = await loop.run_in_executor(None, functools.partial(paragraph.text.replace,
-                '{{COLOR}}', 
-                params['colour_map']))
-
-
-async def load_and_preprocess_data() -> pd.DataFrame:
-    """
-    Загрузка и предварительная обработка данных.
-    
-    Возвращает:
-        pd.DataFrame: Обработанный DataFrame
-    """
-    loop = asyncio.get_running_loop()
-    df = await loop.run_in_executor(None, functools.partial(pd.read_csv, 'data/ds_salaries.csv', sep=','))
-    
-    # Удаление ненужных столбцов
-    df = df.drop(["salary", "salary_currency"], axis=1)
-    
-    # Преобразование категориальных переменных в числовые
-    mapping_dicts = {
-        'experience_level': {'SE': 1, 'MI': 2, 'EN': 3, 'EX': 4},
-        'employment_type': {'FT': 1, 'CT': 2, 'FL': 3, 'PT': 4},
-        'company_size': {'S': 1, 'M': 2, 'L': 3}
-    }
-    
-    for col, mapping in mapping_dicts.items():
-        df[col] = df[col].map(mapping)
-    
-    return df
+    texts['{{PROCENT}}'] = str(int(params['test_size'] * 100))
+    texts['{{RANDOM_STATE}}'] = str(params['random_state'])
+    texts['{{COLOR}}'] = params['colour_map']
 
 
-async def insert_correlation_heatmap(
-    doc: Document, 
-    df: pd.DataFrame, 
-    colour_map: str
-) -> None:
+def insert_correlation_heatmap(images: Dict[str, BinaryIO], colour_map: str) -> None:
     """
-    Генерация и вставка тепловой карты корреляций в документ.
+    Подготовка тепловой карты корреляций для вставки в документ.
     
     Аргументы:
-        doc: Объект документа Word
-        df: DataFrame с данными
+        images: Словарь изображений для плейсхолдеров, дополняется на месте
         colour_map: Цветовая схема для визуализации
     """
-    loop = asyncio.get_running_loop()
-    corr_matrix = await loop.run_in_executor(None, functools.partial(df.corr, numeric_only=True))
-    corr_matrix = corr_matrix.round(2)
-    
-    await loop.run_in_executor(None, functools.partial(plt.figure, figsize=(9, 6)))
-    await loop.run_in_executor(None, functools.partial(sns.heatmap, corr_matrix, cmap=colour_map, annot=True))
-    
-    image_path = await save_temp_image()
-    await insert_image_to_doc(doc, '{{IMAGE1}}', image_path)
+    images['{{IMAGE1}}'] = io.BytesIO(get_heatmap_png(colour_map))
 
 
-async def prepare_modeling_data(
-    df: pd.DataFrame, 
-    test_size: float, 
-    random_state: int
-) -> tuple:
+def get_heatmap_png(colour_map: str) -> bytes:
     """
-    Подготовка данных для моделирования с разделением на train/test.
+    Возвращает PNG тепловой карты корреляций для цветовой схемы.
+
+    Матрица корреляций одинакова для всех отчетов, поэтому каждая из
+    цветовых схем рендерится один раз, а затем берется из кэша в памяти
+    или из каталога HEATMAP_CACHE_DIR.
     
     Аргументы:
-        df: Исходный DataFrame
-        test_size: Доля тестовой выборки
-        random_state: Seed для воспроизводимости
+        colour_map: Цветовая схема для визуализации
     
     Возвращает:
-        tuple: (X_train, X_test, y_train, y_test)
+        bytes: Изображение в формате PNG
     """
-    loop = asyncio.get_running_loop()
-    feature_columns = df[['work_year', 'experience_level', 'employment_type']]
-    target_column = df['salary_in_usd']
-    
-    return await loop.run_in_executor(None, functools.partial(train_test_split,
-        feature_columns,
-        target_column,
-        test_size=test_size,
-        random_state=random_state,
-    ))
+    image = heatmap_cache.get(colour_map)
+    if image is not None:
+        return image
 
+    image_path = None
+    if settings.HEATMAP_CACHE_DIR:
+        image_path = os.path.join(
+            settings.HEATMAP_CACHE_DIR,
+            f"heatmap.{get_statistics().key}.{colour_map}.png"
+        )
+        try:
+            with open(image_path, 'rb') as f:
+                image = f.read()
+        except OSError:
+            pass
 
-async def update_dataset_sizes(
-    doc: Document, 
-    X_train: pd.DataFrame, 
-    X_test: pd.DataFrame
-) -> None:
-    """
-    Обновление информации о размерах выборок в документе.
-    
-    Аргументы:
-        doc: Объект документа Word
-        X_train: Обучающая выборка
-        X_test: Тестовая выборка
-    """
-    loop = asyncio.get_running_loop()
-    for paragraph in doc.paragraphs:
-        if '{{LEANING}}' in paragraph.text:
-            paragraph.text = await loop.run_in_executor(None, functools.partial(paragraph.text.replace,
-                '{{LEANING}}', 
-                str(X_train.shape[0])))
-            
-        if '{{TEST}}' in paragraph.text:
-            paragraph.text = await loop.run_in_executor(None, functools.partial(paragraph.text.replace,
-                '{{TEST}}', 
-                str(X_test.shape[0])))
+    if image is None:
+        image = render_heatmap_png(get_correlation_matrix(), colour_map)
+        if image_path is not None:
+            os.makedirs(settings.HEATMAP_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{image_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(image)
+            os.replace(tmp_path, image_path)
 
+    heatmap_cache.set(colour_map, image)
+    return image
 
-async def perform_linear_regression(
-    doc: Document, 
-    X_train: pd.DataFrame, 
-    X_test: pd.DataFrame, 
-    y_train: pd.Series, 
-    y_test: pd.Series
-) -> None:
+
+def prepare_modeling_data(test_size: float, random_state: int) -> ModelingResults:
     """
-    Выполнение линейной регрессии и обновление документа с результатами.
+    Подготовка данных и обучение моделей с разделением на train/test.
+
+    Результаты кэшируются по паре (test_size, random_state), поэтому
+    повторные комбинации параметров не обращаются к sklearn.
     
     Аргументы:
-        doc: Объект документа Word
-        X_train: Обучающие признаки
-        X_test: Тестовые признаки
-        y_train: Обучающая целевая переменная
-        y_test: Тестовая целевая переменная
-    """
-    loop = asyncio.get_running_loop()
-    model = LinearRegression()
-    await loop.run_in_executor(None, functools.partial(model.fit, X_train, y_train))
-    y_pred = await loop.run_in_executor(None, functools.partial(model.predict, X_test))
-    
-    # Расчет метрик
-    metrics_data = {
-        'ROOT_MEAN1': f'Root Mean Squared Error (RMSE): {np.sqrt(metrics.mean_squared_error(y_test, y_pred))}',
-        'R1': f'R2: {np.round(metrics.r2_score(y_test, y_pred), 2)}'
-    }
-    
-    # Обновление документа с метриками
-    for key, value in metrics_data.items():
-        for paragraph in doc.paragraphs:
-            if f'{{{{{key}}}}}' in paragraph.text:
-                paragraph.text = paragraph.text.replace(f'{{{{{key}}}}}', value)
+        test_size: Доля тестовой выборки
+        random_state: Seed для воспроизводимости
     
-    # Генерация и вставка графика предсказаний
-    await generate_prediction_plot(y_test, y_pred, "Linear Regression")
-    await insert_image_to_doc(doc, '{{IMAGE2}}', await save_temp_image())
+    Возвращает:
+        ModelingResults: Размеры выборок, метрики и предсказания моделей
+    """
+    return get_modeling_results(test_size, random_state)
 
 
-async def perform_knn_regression(
-    doc: Document, 
-    X_train: pd.DataFrame, 
-    X_test: pd.DataFrame, 
-    y_train: pd.Series, 
-    y_test: pd.Series
-) -> None:
+def update_dataset_sizes(texts: Dict[str, str], train_size: int, test_size: int) -> None:
     """
-    Выполнение регрессии k-ближайших соседей и обновление документа.
+    Подготовка информации о размерах выборок для документа.
     
     Аргументы:
-        doc: Объект документа Word
-        X_train: Обучающие признаки
-        X_test: Тестовые признаки
-        y_train: Обучающая целевая переменная
-        y_test: Тестовая целевая переменная
+        texts: Словарь замен плейсхолдеров, дополняется на месте
+        train_size: Размер обучающей выборки
+        test_size: Размер тестовой выборки
     """
-    loop = asyncio.get_running_loop()
-    model = KNeighborsRegressor()
-    await loop.run_in_executor(None, functools.partial(model.fit, X_train, y_train))
-    y_pred = await loop.run_in_executor(None, functools.partial(model.predict, X_test))
-    
-    # Расчет метрик
-    metrics_data = {
-        'ROOT_MEAN2': f'Root Mean Squared Error (RMSE): {np.round(np.sqrt(metrics.mean_squared_error(y_test, y_pred)), 2)}',
-        'R2': f'R2: {np.round(metrics.r2_score(y_test, y_pred), 2)}'
-    }
-    
-    # Обновление документа с метриками
-    for key, value in metrics_data.items():
-        for paragraph in doc.paragraphs:
-            if f'{{{{{key}}}}}' in paragraph.text:
-                paragraph.text = paragraph.text.replace(f'{{{{{key}}}}}', value)
-    
-    # Генерация и вставка графика предсказаний
-    await generate_prediction_plot(y_test, y_pred, "kNN")
-    await insert_image_to_doc(doc, '{{IMAGE3}}', await save_temp_image())
+    texts['{{LEANING}}'] = str(train_size)
+    texts['{{TEST}}'] = str(test_size)
 
 
-async def generate_prediction_plot(
-    y_test: pd.Series, 
-    y_pred: np.array, 
-    model_name: str
+def perform_linear_regression(
+    texts: Dict[str, str], 
+    images: Dict[str, BinaryIO], 
+    results: ModelingResults
 ) -> None:
     """
-    Генерация графика сравнения предсказанных и реальных значений.
+    Подготовка результатов линейной регрессии для документа.
     
     Аргументы:
-        y_test: Реальные значения
-        y_pred: Предсказанные значения
-        model_name: Название модели для легенды
+        texts: Словарь замен плейсхолдеров, дополняется на месте
+        images: Словарь изображений для плейсхолдеров, дополняется на месте
+        results: Результаты моделирования
     """
-    loop = asyncio.get_running_loop()
-    order = await loop.run_in_executor(None, functools.partial(np.argsort, y_test.values))
-    y_test_ordered = y_test.values[order]
-    y_pred_ordered = y_pred[order]
+    # Метрики
+    texts['{{ROOT_MEAN1}}'] = results.linear.rmse
+    texts['{{R1}}'] = results.linear.r2
     
-    await loop.run_in_executor(None, functools.partial(plt.figure, figsize=(10, 8)))
-    await loop.run_in_executor(None, functools.partial(plt.scatter, y_test_ordered, y_pred_ordered, label=model_name))
-    await loop.run_in_executor(None, functools.partial(plt.plot, y_test_ordered, y_test_ordered, label="True values", color="red"))
-    await loop.run_in_executor(None, plt.legend)
-    await loop.run_in_executor(None, functools.partial(plt.xlabel, "Истинные значения"))
-    await loop.run_in_executor(None, functools.partial(plt.ylabel, "Предсказанные значения"))
+    # Генерация графика предсказаний
+    images['{{IMAGE2}}'] = io.BytesIO(render_prediction_plot_png(
+        results.y_test, results.linear.y_pred, "Linear Regression"))
 
 
-async def save_temp_image() -> str:
-    """
-    Сохранение текущего графика matplotlib во временный файл.
-    
-    Возвращает:
-        str: Путь к сохраненному изображению
-    """
-    loop = asyncio.get_running_loop()
-    image_path = f"{uuid.uuid4()}.png"
-    await loop.run_in_executor(None, functools.partial(plt.savefig, image_path))
-    await loop.run_in_executor(None, plt.close)
-    return image_path
-
-
-async def insert_image_to_doc(
-    doc: Document, 
-    placeholder: str, 
-    image_path: str
+def perform_knn_regression(
+    texts: Dict[str, str], 
+    images: Dict[str, BinaryIO], 
+    results: ModelingResults
 ) -> None:
     """
-    Вставка изображения в документ на место плейсхолдера.
+    Подготовка результатов регрессии k-ближайших соседей для документа.
     
     Аргументы:
-        doc: Объект документа Word
-        placeholder: Плейсхолдер для замены
-        image_path: Путь к файлу изображения
+        texts: Словарь замен плейсхолдеров, дополняется на месте
+        images: Словарь изображений для плейсхолдеров, дополняется на месте
+        results: Результаты моделирования
     """
-    loop = asyncio.get_running_loop()
-    for paragraph in doc.paragraphs:
-        if placeholder in paragraph.text:
-            paragraph.text = await loop.run_in_executor(None, functools.partial(paragraph.text.replace, placeholder, ''))
-            run = await loop.run_in_executor(None, functools.partial(paragraph.add_run))
-            await loop.run_in_executor(None, functools.partial(run.add_picture, image_path, width=Inches(7)))
-    await loop.run_in_executor(None, functools.partial(os.remove, image_path))
+    # Метрики
+    texts['{{ROOT_MEAN2}}'] = results.knn.rmse
+    texts['{{R2}}'] = results.knn.r2
+    
+    # Генерация графика предсказаний
+    images['{{IMAGE3}}'] = io.BytesIO(render_prediction_plot_png(
+        results.y_test, results.knn.y_pred, "kNN"))
 
 
-async def save_final_document(doc: Document) -> str:
+def save_final_document(doc: Document) -> bytes:
     """
-    Сохранение итогового документа.
+    Сохранение итогового документа в память.
     
     Аргументы:
         doc: Объект документа Word
     
     Возвращает:
-        str: Путь к сохраненному файлу
+        bytes: Содержимое файла отчета (.docx)
     """
-    loop = asyncio.get_running_loop()
-    file_path = f"{uuid.uuid4()}.docx"
-    await loop.run_in_executor(None, functools.partial(doc.save, file_path))
-    return file_path
\ No newline at end of file
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
@@ -0,0 +1,224 @@
+"""
+Пакетная выдача отчетов администратору по списку платежей.
+
+Недостающие отчеты генерируются на отдельной полосе с низким приоритетом:
+задания ставятся в пул report_pool фоновым классом, ограниченным числом
+одновременно, и не берут отчеты из запаса для покупателей. Результаты приходят
+пакетами sendMediaGroup (с привязкой file_id к платежам) или zip-архивами,
+а прогресс обновляется в одном сообщении.
+"""
+import asyncio
+import io
+import time
+import zipfile
+from typing import AsyncIterator, List, Sequence, Tuple
+
+from aiogram.types import BufferedInputFile, Message
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from artifacts import artifact_store
+from delivery import MEDIA_GROUP_SIZE, deliver_payments, payment_flights
+from payments import count_payments_without_file, get_payments, iter_payments_without_file
+from reports import get_project_document
+from settings import settings
+from workers import PRIORITY_BACKGROUND
+
+# Минимальный интервал между обновлениями сообщения о прогрессе
+PROGRESS_INTERVAL = 2.0
+
+
+class BatchLane:
+    """
+    Полоса генерации с низким приоритетом.
+
+    Не больше concurrency заданий одновременно, все с фоновым приоритетом,
+    поэтому заказы покупателей не ждут за длинной очередью пакетной
+    генерации.
+    """
+
+    def __init__(self, concurrency: int) -> None:
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def render(self, provider_payment_id: str) -> bytes:
+        """
+        Отчет для платежа; одновременная генерация по тому же платежу
+        (например, повторная выдача покупателю) переиспользуется.
+        """
+        async def produce() -> bytes:
+            async with self._semaphore:
+                return await get_project_document(PRIORITY_BACKGROUND)
+
+        return await payment_flights.run(provider_payment_id, produce)
+
+
+# Общая полоса пакетной генерации
+batch_lane = BatchLane(settings.ADMIN_BATCH_CONCURRENCY)
+
+
+class Progress:
+    """
+    Сообщение о ходе пакетной выдачи, обновляемое не чаще PROGRESS_INTERVAL.
+    """
+
+    def __init__(self, message: Message, total: int) -> None:
+        self.message = message
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self._updated = 0.0
+
+    def text(self) -> str:
+        text = f"⏳ Пакетная выдача: {self.done}/{self.total}"
+        if self.failed:
+            text += f", ошибок: {self.failed}"
+        return text
+
+    async def update(self, done: int = 0, failed: int = 0, force: bool = False) -> None:
+        self.done += done
+        self.failed += failed
+        now = time.monotonic()
+        if not force and now - self._updated < PROGRESS_INTERVAL:
+            return
+        self._updated = now
+        try:
+            await self.message.edit_text(self.text())
+        except Exception:
+            # Текст не изменился или сообщение удалено — прогресс не критичен
+            pass
+
+
+async def _chunks(payments: Sequence[dict]) -> AsyncIterator[List[dict]]:
+    for start in range(0, len(payments), MEDIA_GROUP_SIZE):
+        yield list(payments[start:start + MEDIA_GROUP_SIZE])
+
+
+async def export_payments(
+    message: Message,
+    session: AsyncSession,
+    provider_payment_ids: Sequence[str],
+    as_zip: bool = False,
+) -> None:
+    """
+    Выдает администратору отчеты по платежам.
+
+    Аргументы:
+        message: Сообщение команды; в его чат отправляются отчеты и прогресс
+        session: Сессия БД текущего обновления
+        provider_payment_ids: ID платежей (пусто — все платежи без file_id)
+        as_zip: Отправить zip-архивами вместо пакетов документов
+    """
+    if provider_payment_ids:
+        payments = await get_payments(session, provider_payment_ids)
+        found = {payment["provider_payment_id"] for payment in payments}
+        not_found = [i for i in dict.fromkeys(provider_payment_ids) if i not in found]
+        if not_found:
+            await message.answer("Не найдены ID: " + ", ".join(not_found))
+        total = len(payments)
+        pages = _chunks(payments)
+    else:
+        total = await count_payments_without_file(session)
+        pages = iter_payments_without_file(session, MEDIA_GROUP_SIZE)
+
+    if not total:
+        await message.answer("Нет платежей для выдачи.")
+        return
+
+    progress = Progress(await message.answer(f"⏳ Пакетная выдача: 0/{total}"), total)
+    if as_zip:
+        await _export_zip(message, session, pages, progress)
+    else:
+        await _export_media(message, session, pages, progress)
+    await progress.update(force=True)
+    await message.answer(f"✅ Пакетная выдача завершена: {progress.done}/{total}")
+
+
+async def _export_media(
+    message: Message,
+    session: AsyncSession,
+    pages: AsyncIterator[List[dict]],
+    progress: Progress,
+) -> None:
+    """
+    Пакеты sendMediaGroup; file_id сгенерированных отчетов привязываются к платежам.
+
+    Отчеты страницы генерируются заранее, чтобы она ушла полными группами,
+    а не по одному документу по мере готовности: отправка в чат ограничена
+    по частоте.
+    """
+    async for page in pages:
+        # Транзакция чтения не держится во время генерации
+        await session.commit()
+        missing = [payment["provider_payment_id"] for payment in page if not payment["file_id"]]
+        results = await asyncio.gather(*map(batch_lane.render, missing), return_exceptions=True)
+        documents = dict(zip(missing, results))
+
+        async def rendered(provider_payment_id: str) -> bytes:
+            result = documents[provider_payment_id]
+            if isinstance(result, BaseException):
+                raise result
+            return result
+
+        # Ошибки генерации и отправки deliver_payments сообщает в чат сам
+        delivered = await deliver_payments(message, session, page, render=rendered)
+        await progress.update(done=delivered, failed=len(page) - delivered)
+
+
+async def _export_zip(
+    message: Message,
+    session: AsyncSession,
+    pages: AsyncIterator[List[dict]],
+    progress: Progress,
+) -> None:
+    """
+    Zip-архивы не больше ADMIN_BATCH_ZIP_MB; уже выгруженные отчеты скачиваются
+    по file_id, недостающие генерируются. file_id к платежам не привязываются.
+    """
+    limit = settings.ADMIN_BATCH_ZIP_MB * 1024 * 1024
+    files: List[Tuple[str, bytes]] = []
+    size = 0
+    part = 1
+
+    async def document(payment: dict) -> bytes:
+        if payment["file_id"]:
+            buffer = await message.bot.download(payment["file_id"])
+            return buffer.getvalue()
+        return await batch_lane.render(payment["provider_payment_id"])
+
+    async for page in pages:
+        # Транзакция чтения не держится во время генерации
+        await session.commit()
+        results = await asyncio.gather(*(document(payment) for payment in page), return_exceptions=True)
+        for payment, result in zip(page, results):
+            if isinstance(result, BaseException):
+                await message.answer(f"❌ {payment['provider_payment_id']}: {str(result)}")
+                await progress.update(failed=1)
+                continue
+            if not payment["file_id"]:
+                # Отчет выдается по платежу, хоть и без file_id
+                artifact_store.mark_used(result)
+            if files and size + len(result) > limit:
+                await _send_zip(message, files, part)
+                files, size, part = [], 0, part + 1
+            files.append((payment["provider_payment_id"], result))
+            size += len(result)
+            await progress.update(done=1)
+
+    if files:
+        await _send_zip(message, files, part)
+
+
+async def _send_zip(message: Message, files: Sequence[Tuple[str, bytes]], part: int) -> None:
+    archive = await asyncio.to_thread(_build_zip, files)
+    await message.answer_document(
+        BufferedInputFile(archive, filename=f"projects_{part}.zip"),
+        caption=f"Архив {part}: {len(files)} шт.",
+    )
+
+
+def _build_zip(files: Sequence[Tuple[str, bytes]]) -> bytes:
+    # .docx уже сжат, поэтому файлы сохраняются без повторного сжатия
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        for provider_payment_id, document in files:
+            archive.writestr(f"{provider_payment_id}.docx", document)
+    return buffer.getvalue()
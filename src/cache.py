@@ -0,0 +1,84 @@
+"""
+Простой LRU-кэш для результатов генерации внутри процесса
+и объединение одновременных вызовов по ключу.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+class LRUCache:
+    """
+    Ограниченный по размеру кэш с вытеснением давно неиспользуемых записей.
+
+    Если задан ttl (в секундах), записи старше него считаются отсутствующими.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None) -> None:
+        self.maxsize = max(0, maxsize)
+        self.ttl = ttl if ttl else None
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+
+    def _expired(self, expires: Optional[float]) -> bool:
+        return expires is not None and expires <= time.monotonic()
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """
+        Возвращает значение по ключу и отмечает запись как недавно использованную.
+        """
+        try:
+            value, expires = self._data[key]
+        except KeyError:
+            return default
+        if self._expired(expires):
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Сохраняет значение, вытесняя самые старые записи при переполнении.
+        """
+        if self.maxsize == 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __contains__(self, key: Hashable) -> bool:
+        item = self._data.get(key)
+        return item is not None and not self._expired(item[1])
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SingleFlight:
+    """
+    Объединение одновременных вызовов с одинаковым ключом.
+
+    Пока вызов по ключу выполняется, остальные вызывающие ждут его результат
+    вместо запуска собственного. Отмена одного из ожидающих не отменяет
+    вызов для остальных.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Выполняет func() или присоединяется к уже выполняющемуся вызову по key.
+        """
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(func())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._inflight
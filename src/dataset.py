@@ -0,0 +1,440 @@
+"""
+Датасет зарплат: однократная загрузка, кодирование и кэш матрицы признаков.
+
+Читаются только столбцы, которые использует пайплайн, сразу в компактных
+типах: строки категорий — как category, числа — как int8/int16/int32,
+коды категорий — как Int8. CSV читается частями, поддерживается Parquet
+(нужен pyarrow).
+
+Средние и ко-моменты столбцов для матрицы корреляций хранятся отдельно
+(stats.Moments) и при дописывании строк в CSV обновляются только по новым
+строкам.
+"""
+import functools
+import hashlib
+import io
+import os
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from settings import settings
+from stats import Moments
+
+
+# Путь к исходному датасету (.csv или .parquet)
+DATASET_PATH = settings.DATASET_PATH
+
+# Признаки и целевая переменная для моделирования
+FEATURE_COLUMNS = ['work_year', 'experience_level', 'employment_type']
+TARGET_COLUMN = 'salary_in_usd'
+
+# Кодирование категориальных переменных в числовые
+MAPPING_DICTS = {
+    'experience_level': {'SE': 1, 'MI': 2, 'EN': 3, 'EX': 4},
+    'employment_type': {'FT': 1, 'CT': 2, 'FL': 3, 'PT': 4},
+    'company_size': {'S': 1, 'M': 2, 'L': 3}
+}
+
+# Столбцы, которые использует пайплайн, и их типы при чтении.
+# job_title, employee_residence, company_location, salary и salary_currency
+# не участвуют ни в моделях, ни в матрице корреляций и не читаются
+COLUMN_DTYPES = {
+    'work_year': 'int16',
+    'experience_level': 'category',
+    'employment_type': 'category',
+    'salary_in_usd': 'int32',
+    'remote_ratio': 'int8',
+    'company_size': 'category',
+}
+
+# Тип кодов категорий: Int8 хранит пропуск (код не найден) без перехода к float64
+CODE_DTYPE = 'Int8'
+
+# Столбцы статистики для матрицы корреляций: после кодирования все числовые
+STAT_COLUMNS = list(COLUMN_DTYPES)
+
+
+@dataclass(frozen=True)
+class Dataset:
+    """
+    Подготовленный датасет, общий для всех отчетов процесса.
+
+    Закодированный DataFrame не хранится: моделям нужны только признаки
+    и целевая переменная, а при кэше на диске они читаются из .npy-файлов
+    без разбора CSV.
+
+    Атрибуты:
+        key: Ключ версии датасета (dataset_key) на момент загрузки; им
+            именуются производные кэш-файлы, чтобы данные процесса и имя
+            файла не разошлись, если датасет изменится во время работы
+        features: Матрица признаков FEATURE_COLUMNS (только для чтения)
+        target: Целевая переменная TARGET_COLUMN (только для чтения)
+    """
+    key: str
+    features: np.ndarray
+    target: np.ndarray
+
+
+@dataclass(frozen=True)
+class Statistics:
+    """
+    Статистика столбцов датасета для матрицы корреляций.
+
+    Атрибуты:
+        key: Ключ версии датасета (dataset_key) на момент чтения
+        moments: Средние и ко-моменты столбцов STAT_COLUMNS
+    """
+    key: str
+    moments: Moments
+
+
+def _read_chunks(path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """
+    Чтение нужных столбцов файла частями по chunk_rows строк (0 — целиком).
+    """
+    columns = list(COLUMN_DTYPES)
+    if path.endswith('.parquet'):
+        if not chunk_rows:
+            yield pd.read_parquet(path, columns=columns)
+            return
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    yield from _read_csv_chunks(path, chunk_rows)
+
+
+def _read_csv_chunks(source, chunk_rows: int, names: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """
+    Чтение нужных столбцов CSV частями; names — заголовок, если его нет в source.
+    """
+    reader = pd.read_csv(
+        source,
+        sep=',',
+        header=None if names else 'infer',
+        names=names,
+        usecols=list(COLUMN_DTYPES),
+        dtype=COLUMN_DTYPES,
+        chunksize=chunk_rows or None,
+    )
+    if not chunk_rows:
+        yield reader
+        return
+    with reader:
+        yield from reader
+
+
+def _encode(chunk: pd.DataFrame) -> pd.DataFrame:
+    """
+    Приведение типов и кодирование категорий в числовые коды.
+    """
+    chunk = chunk[list(COLUMN_DTYPES)].astype(COLUMN_DTYPES)
+    for col, mapping in MAPPING_DICTS.items():
+        chunk[col] = chunk[col].map(mapping).astype(CODE_DTYPE)
+    return chunk
+
+
+def read_encoded_frame(path: str = DATASET_PATH, chunk_rows: int = settings.DATASET_CHUNK_ROWS) -> pd.DataFrame:
+    """
+    Чтение нужных столбцов в компактных типах и кодирование категорий.
+
+    Каждая часть кодируется сразу после чтения, поэтому строковые
+    значения целиком в памяти не держатся.
+
+    Аргументы:
+        path: Путь к CSV- или Parquet-файлу
+        chunk_rows: Размер части в строках (0 — читать целиком)
+
+    Возвращает:
+        pd.DataFrame: Обработанный DataFrame
+    """
+    chunks = [_encode(chunk) for chunk in _read_chunks(path, chunk_rows)]
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def dataset_key(path: str = DATASET_PATH) -> str:
+    """
+    Короткий ключ версии датасета.
+
+    Строится по пути, размеру и времени изменения CSV, поэтому при замене
+    датасета все производные кэши пересобираются автоматически.
+    """
+    stat = os.stat(path)
+    return hashlib.sha1(
+        f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()
+    ).hexdigest()[:16]
+
+
+def feature_matrix(frame: pd.DataFrame) -> np.ndarray:
+    """
+    Матрица признаков в int64, как у модели на исходных типах.
+
+    Пропуск в коде категории дает ошибку здесь, а не NaN в модели.
+    """
+    return frame[FEATURE_COLUMNS].to_numpy(dtype=np.int64)
+
+
+def target_vector(frame: pd.DataFrame) -> np.ndarray:
+    """
+    Целевая переменная в int64.
+    """
+    return frame[TARGET_COLUMN].to_numpy(dtype=np.int64)
+
+
+def _sidecar_paths(path: str, cache_dir: str, key: str) -> Tuple[str, str]:
+    """
+    Пути к .npy-файлам признаков и целевой переменной.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    return (
+        os.path.join(cache_dir, f"{name}.{key}.features.npy"),
+        os.path.join(cache_dir, f"{name}.{key}.target.npy"),
+    )
+
+
+def _load_sidecar(path: str, cache_dir: str, key: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Загрузка матрицы признаков из .npy-файлов, отображенных в память.
+
+    Датасет разбирается только при отсутствии файлов, чтобы их создать.
+    Процессы-воркеры открывают одни и те же файлы, и ОС разделяет их
+    страницы между процессами.
+    """
+    features_path, target_path = _sidecar_paths(path, cache_dir, key)
+    if not (os.path.exists(features_path) and os.path.exists(target_path)):
+        frame = read_encoded_frame(path)
+        os.makedirs(cache_dir, exist_ok=True)
+        for file_path, values in (
+            (features_path, feature_matrix(frame)),
+            (target_path, target_vector(frame)),
+        ):
+            # Запись через временный файл, чтобы воркеры не прочитали его частично
+            tmp_path = f"{file_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, values)
+            os.replace(tmp_path, file_path)
+
+    return (
+        np.load(features_path, mmap_mode='r'),
+        np.load(target_path, mmap_mode='r'),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_dataset(path: str = DATASET_PATH) -> Dataset:
+    """
+    Возвращает подготовленный датасет, загружая его при первом обращении.
+
+    Аргументы:
+        path: Путь к CSV- или Parquet-файлу
+
+    Возвращает:
+        Dataset: Ключ версии, признаки и целевая переменная
+    """
+    # Ключ берется до чтения: если файл изменится во время загрузки, данные
+    # окажутся под ключом прежней версии, который больше никто не вычислит
+    key = dataset_key(path)
+    if settings.DATASET_CACHE_DIR:
+        features, target = _load_sidecar(path, settings.DATASET_CACHE_DIR, key)
+    else:
+        frame = read_encoded_frame(path)
+        features = feature_matrix(frame)
+        target = target_vector(frame)
+        features.setflags(write=False)
+        target.setflags(write=False)
+
+    return Dataset(key=key, features=features, target=target)
+
+
+def frame_moments(frame: pd.DataFrame) -> Moments:
+    """
+    Статистика столбцов STAT_COLUMNS закодированного DataFrame.
+
+    Строки с пропуском (код категории не найден) пропускаются целиком.
+    """
+    values = frame[STAT_COLUMNS].to_numpy(dtype=np.float64, na_value=np.nan)
+    return Moments.from_array(STAT_COLUMNS, values[~np.isnan(values).any(axis=1)])
+
+
+class _ByteRange(io.RawIOBase):
+    """
+    Байты файла в диапазоне [start, end) как поток только для чтения.
+    """
+
+    def __init__(self, f: BinaryIO, start: int, end: int) -> None:
+        super().__init__()
+        f.seek(start)
+        self._f = f
+        self._left = end - start
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self._left)
+        if size <= 0:
+            return 0
+        data = self._f.read(size)
+        buffer[:len(data)] = data
+        self._left -= len(data)
+        return len(data)
+
+
+def _complete_end(f: BinaryIO, start: int, end: int) -> int:
+    """
+    Граница после последней полной строки в [start, end): строка, которую
+    еще дописывают, в статистику не попадает.
+    """
+    position = end
+    while position > start:
+        block_start = max(start, position - 65536)
+        f.seek(block_start)
+        index = f.read(position - block_start).rfind(b'\n')
+        if index >= 0:
+            return block_start + index + 1
+        position = block_start
+    return start
+
+
+def _prefix_digests(f: BinaryIO, *offsets: int) -> List[str]:
+    """
+    SHA-1 начала файла [0, offset) для каждого offset (по возрастанию)
+    за одно чтение без разбора строк.
+    """
+    digest = hashlib.sha1()
+    digests = []
+    position = 0
+    f.seek(0)
+    for offset in offsets:
+        while position < offset:
+            block = f.read(min(1 << 20, offset - position))
+            if not block:
+                break
+            digest.update(block)
+            position += len(block)
+        digests.append(digest.hexdigest())
+    return digests
+
+
+def _stats_path(path: str, cache_dir: str) -> str:
+    """
+    Путь к файлу статистики. В отличие от остальных кэшей, не зависит
+    от dataset_key: при дописывании строк файл обновляется, а не создается заново.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f"{name}.stats.npz")
+
+
+def _load_stats(state_path: str, path: str) -> Optional[Tuple[Moments, int, str]]:
+    """
+    Сохраненная статистика, граница обработанных байт и хэш файла до нее.
+    Возвращает None, если файла нет или он записан для другого датасета.
+    """
+    try:
+        with np.load(state_path) as data:
+            if str(data['source']) != os.path.abspath(path) or [str(c) for c in data['columns']] != STAT_COLUMNS:
+                return None
+            return Moments.from_dict(data), int(data['offset']), str(data['digest'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _save_stats(state_path: str, path: str, moments: Moments, offset: int, digest: str) -> None:
+    """
+    Атомарная запись статистики.
+    """
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    tmp_path = f"{state_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, source=os.path.abspath(path), offset=offset, digest=digest, **moments.to_dict())
+    os.replace(tmp_path, state_path)
+
+
+def _merge_csv(moments: Moments, f: BinaryIO, start: int, end: int, names: List[str]) -> Moments:
+    """
+    Статистика moments, дополненная строками CSV в байтах [start, end).
+    """
+    source = io.BufferedReader(_ByteRange(f, start, end))
+    for chunk in _read_csv_chunks(source, settings.DATASET_CHUNK_ROWS, names):
+        moments = moments.merge(frame_moments(_encode(chunk)))
+    return moments
+
+
+@functools.lru_cache(maxsize=None)
+def get_statistics(path: str = DATASET_PATH) -> Statistics:
+    """
+    Средние и ко-моменты столбцов STAT_COLUMNS всего датасета.
+
+    Для CSV статистика полных строк сохраняется в DATASET_CACHE_DIR вместе
+    с границей обработанных байт и хэшем файла до нее. Если начало файла
+    не изменилось, то есть строки только дописывались, разбираются
+    и добавляются лишь новые строки — за O(новых строк); файл при этом
+    только хэшируется. При любом другом изменении статистика строится
+    заново. Последняя строка без перевода строки учитывается, как
+    в get_dataset, но не сохраняется: ее могут еще дописывать. Parquet-файлы
+    не дописываются, для них статистика считается по всему файлу.
+
+    Аргументы:
+        path: Путь к CSV- или Parquet-файлу
+
+    Возвращает:
+        Statistics: Ключ версии датасета и статистика столбцов
+    """
+    if path.endswith('.parquet'):
+        key = dataset_key(path)
+        return Statistics(key=key, moments=frame_moments(read_encoded_frame(path)))
+
+    cache_dir = settings.DATASET_CACHE_DIR
+    state_path = _stats_path(path, cache_dir) if cache_dir else None
+    with open(path, 'rb') as f:
+        key = dataset_key(path)
+        header = f.readline()
+        names = header.decode().strip().split(',')
+        size = os.fstat(f.fileno()).st_size
+        end = _complete_end(f, len(header), size)
+
+        state = _load_stats(state_path, path) if state_path else None
+        if state is not None and len(header) <= state[1] <= end:
+            digest, end_digest = _prefix_digests(f, state[1], end)
+        else:
+            digest, end_digest = None, _prefix_digests(f, end)[0]
+
+        matched = digest is not None and digest == state[2]
+        if matched:
+            moments, start = state[0], state[1]
+        else:
+            moments, start = Moments(STAT_COLUMNS), len(header)
+
+        if start < end:
+            moments = _merge_csv(moments, f, start, end, names)
+        if state_path and (start < end or not matched):
+            _save_stats(state_path, path, moments, end, end_digest)
+
+        f.seek(end)
+        if f.read(size - end).strip():
+            moments = _merge_csv(moments, f, end, size, names)
+    return Statistics(key=key, moments=moments)
+
+
+@functools.lru_cache(maxsize=None)
+def get_correlation_matrix(path: str = DATASET_PATH) -> pd.DataFrame:
+    """
+    Матрица корреляций числовых столбцов, округленная до двух знаков.
+
+    Строится по статистике get_statistics без прохода по строкам датасета;
+    кэш-файлы, производные от матрицы, именуются ключом get_statistics().key.
+
+    Аргументы:
+        path: Путь к CSV- или Parquet-файлу
+
+    Возвращает:
+        pd.DataFrame: Матрица корреляций
+    """
+    moments = get_statistics(path).moments
+    return pd.DataFrame(moments.correlation(), index=moments.columns, columns=moments.columns).round(2)
@@ -0,0 +1,234 @@
+"""
+Выдача заказов пользователю.
+
+Отчет для платежа генерируется не больше одного раза одновременно.
+Готовые документы отправляются пакетами sendMediaGroup (до 10 штук) через
+лимитер отправки в чат, а недостающие отчеты генерируются параллельно
+с отправкой и выгружаются пакетами по мере готовности.
+"""
+import asyncio
+import functools
+import time
+from typing import Awaitable, Callable, Hashable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import BufferedInputFile, InputMediaDocument, Message
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from artifacts import artifact_store
+from reports import get_project_document
+from cache import LRUCache, SingleFlight
+from payments import set_file_id_for_provider
+from settings import settings
+from stock import report_stock
+from telemetry import FILE_ID_CACHE, TELEGRAM_UPLOAD
+from workers import PRIORITY_FRESH, PRIORITY_RESEND
+
+# Максимум документов в одном sendMediaGroup
+MEDIA_GROUP_SIZE = 10
+
+# Документ к отправке: ID платежа, file_id или файл, подпись
+Item = Tuple[str, Union[str, BufferedInputFile], str]
+
+# Получение отчета по ID платежа
+Render = Callable[[str], Awaitable[bytes]]
+
+
+class TokenBucket:
+    """
+    Лимитер "ведро токенов": rate запросов в секунду с запасом capacity.
+    """
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        """
+        Ждет, пока в ведре появится токен, и забирает его.
+        """
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# Лимитеры отправки по чатам: chat_id -> TokenBucket
+_chat_buckets = LRUCache(10000)
+
+# Генерации отчетов, выполняющиеся сейчас: provider_payment_id -> отчет
+payment_flights = SingleFlight()
+
+
+def chat_bucket(chat_id: int) -> TokenBucket:
+    """
+    Возвращает лимитер отправки для чата.
+    """
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is None:
+        bucket = TokenBucket(settings.DELIVERY_CHAT_RATE, settings.DELIVERY_CHAT_BURST)
+        _chat_buckets.set(chat_id, bucket)
+    return bucket
+
+
+def _chunks(items: Sequence[Item]) -> Iterator[Sequence[Item]]:
+    for start in range(0, len(items), MEDIA_GROUP_SIZE):
+        yield items[start:start + MEDIA_GROUP_SIZE]
+
+
+async def send_documents(bot: Bot, chat_id: int, items: Sequence[Item], source: str) -> List[Message]:
+    """
+    Отправляет до MEDIA_GROUP_SIZE документов одним запросом.
+
+    Один документ отправляется через sendDocument (sendMediaGroup требует
+    минимум два). При флуд-контроле Telegram запрос повторяется после паузы.
+
+    Аргументы:
+        bot: Экземпляр бота
+        chat_id: ID чата
+        items: Документы к отправке
+        source: Метка для метрик (file_id или upload)
+
+    Возвращает:
+        List[Message]: Отправленные сообщения в порядке items
+    """
+    while True:
+        await chat_bucket(chat_id).acquire()
+        try:
+            with TELEGRAM_UPLOAD.time(source=source):
+                if len(items) == 1:
+                    _, document, caption = items[0]
+                    return [await bot.send_document(chat_id, document, caption=caption)]
+                return await bot.send_media_group(chat_id, [
+                    InputMediaDocument(media=document, caption=caption)
+                    for _, document, caption in items
+                ])
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+
+
+async def get_payment_document(
+    provider_payment_id: str,
+    priority: int = PRIORITY_FRESH,
+    owner: Optional[Hashable] = None,
+) -> bytes:
+    """
+    Отчет для платежа: из запаса или новой генерацией.
+
+    Одновременные запросы по одному платежу (повторная доставка
+    successful_payment, повторное нажатие "Получить все заказы")
+    получают один и тот же отчет, сгенерированный один раз.
+    Запас готовых отчетов расходуется только на новые оплаты.
+
+    Аргументы:
+        provider_payment_id: ID платежа
+        priority: Класс приоритета генерации в пуле
+        owner: Владелец задания для ограничения на пользователя
+
+    Возвращает:
+        bytes: Содержимое файла отчета (.docx)
+    """
+    async def produce() -> bytes:
+        document = report_stock.take() if priority == PRIORITY_FRESH else None
+        return document or await get_project_document(priority, owner)
+
+    return await payment_flights.run(provider_payment_id, produce)
+
+
+async def _generate(provider_payment_id: str, render: Render) -> Tuple[str, bytes]:
+    return provider_payment_id, await render(provider_payment_id)
+
+
+async def deliver_payments(
+    message: Message,
+    session: AsyncSession,
+    payments: Sequence[dict],
+    render: Optional[Render] = None,
+) -> int:
+    """
+    Отправляет пользователю заказы (одну страницу выборки).
+
+    Генерация недостающих отчетов запускается сразу и идет параллельно
+    с отправкой документов, у которых уже есть file_id; готовые отчеты
+    выгружаются пакетами, а их file_id привязываются к платежам.
+
+    Аргументы:
+        message: Сообщение, в чат которого отправляются документы
+        session: Сессия БД текущего обновления
+        payments: Записи платежей с provider_payment_id и file_id
+        render: Получение отчета для платежа без file_id (по умолчанию
+            генерация с приоритетом повторной выдачи)
+
+    Возвращает:
+        int: Число отправленных документов; ошибки генерации и отправки
+            сообщаются в чат и не учитываются
+    """
+    bot, chat_id = message.bot, message.chat.id
+    if render is None:
+        render = functools.partial(get_payment_document, priority=PRIORITY_RESEND, owner=chat_id)
+    cached: List[Item] = []
+    missing: List[str] = []
+    for payment in payments:
+        provider_payment_id = payment["provider_payment_id"]
+        if payment["file_id"]:
+            FILE_ID_CACHE.inc(result="hit")
+            cached.append((provider_payment_id, payment["file_id"], f"ID платежа: {provider_payment_id}"))
+        else:
+            FILE_ID_CACHE.inc(result="miss")
+            missing.append(provider_payment_id)
+
+    # Завершаем транзакцию чтения, чтобы не держать соединение во время генерации
+    await session.commit()
+
+    # Генерация стартует до отправки готовых документов и идет параллельно с ней
+    tasks = [asyncio.create_task(_generate(provider_payment_id, render)) for provider_payment_id in missing]
+    delivered = 0
+    try:
+        for chunk in _chunks(cached):
+            try:
+                await send_documents(bot, chat_id, chunk, source="file_id")
+            except Exception as e:
+                await message.answer(f"❌ Ошибка при отправке файла: {str(e)}")
+                continue
+            delivered += len(chunk)
+
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            ready: List[Item] = []
+            documents = {}
+            for task in done:
+                if task.exception() is not None:
+                    await message.answer(f"❌ Ошибка при отправке файла: {str(task.exception())}")
+                    continue
+                provider_payment_id, document = task.result()
+                documents[provider_payment_id] = document
+                ready.append((
+                    provider_payment_id,
+                    BufferedInputFile(document, filename=f"{provider_payment_id or 'proj'}.docx"),
+                    f"ID платежа: {provider_payment_id}",
+                ))
+
+            for chunk in _chunks(ready):
+                try:
+                    sent_messages = await send_documents(bot, chat_id, chunk, source="upload")
+                except Exception as e:
+                    for provider_payment_id, _, _ in chunk:
+                        artifact_store.release(documents[provider_payment_id])
+                    await message.answer(f"❌ Ошибка при отправке файла: {str(e)}")
+                    continue
+                delivered += len(chunk)
+                for (provider_payment_id, _, _), sent in zip(chunk, sent_messages):
+                    artifact_store.mark_used(documents[provider_payment_id])
+                    await set_file_id_for_provider(session, provider_payment_id, sent.document.file_id)
+    finally:
+        for task in tasks:
+            task.cancel()
+    return delivered
@@ -0,0 +1,367 @@
+"""
+Очередь заданий на генерацию и доставку отчетов, хранящаяся в БД.
+
+Хендлер оплаты только ставит задание и сразу возвращается. Воркер заданий
+забирает готовые к работе задания, генерирует отчеты в пуле
+report_pool, отправляет их в чат и привязывает file_id к платежу.
+Неудачные попытки повторяются с задержкой, а задания, зависшие в работе
+(например, из-за перезапуска процесса), снова берутся в работу.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Set
+
+from aiogram import Bot
+from aiogram.types import BufferedInputFile
+from sqlalchemy import and_, exists, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from artifacts import artifact_store
+from delivery import get_payment_document, send_documents
+from models import (
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_PENDING,
+    JOB_RUNNING,
+    Payment,
+    ReportJob,
+    async_session,
+    insert_or_ignore,
+)
+from payments import get_file_id_for_provider, set_file_id_for_provider
+from settings import settings
+from telemetry import DB_QUERY, PAYMENT_DELIVERY
+from workers import PRIORITY_FRESH
+
+
+logger = logging.getLogger(__name__)
+
+
+def utcnow() -> datetime:
+    """
+    Текущее время UTC без часового пояса (как хранится в БД).
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class ReportJobs:
+    """
+    Воркер заданий на генерацию и доставку отчетов.
+
+    Задание берется в работу условным UPDATE по статусу, поэтому несколько
+    реплик бота могут работать с одной БД, не выполняя задание дважды.
+    started_at последней попытки служит арендой: пока задание выполняется,
+    реплика продлевает ее, а завершает задание, только если аренда
+    по-прежнему за ней.
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        max_attempts: int,
+        poll_interval: float,
+        retry_delay: float,
+        stale_after: float
+    ) -> None:
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.stale_after = stale_after
+        self._bot: Optional[Bot] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+    def notify(self) -> None:
+        """
+        Будит воркер после постановки нового задания.
+        """
+        self._wakeup.set()
+
+    async def enqueue(
+        self,
+        session: AsyncSession,
+        provider_payment_id: str,
+        chat_id: int,
+        receipt_text: str
+    ) -> bool:
+        """
+        Ставит задание на доставку отчета по платежу.
+
+        Аргументы:
+            session: Сессия БД
+            provider_payment_id: ID платежа
+            chat_id: ID чата для доставки
+            receipt_text: Подпись к документу
+
+        Возвращает:
+            bool: True, если задание создано, False — если оно уже было
+        """
+        now = utcnow()
+        values = dict(
+            provider_payment_id=provider_payment_id,
+            chat_id=chat_id,
+            receipt_text=receipt_text,
+            status=JOB_PENDING,
+            attempts=0,
+            created_at=now,
+            available_at=now,
+        )
+        with DB_QUERY.time(query="enqueue_job"):
+            inserted = await insert_or_ignore(
+                session, ReportJob, values, ReportJob.provider_payment_id
+            )
+        if inserted:
+            self.notify()
+        return inserted
+
+    async def redrive(self) -> int:
+        """
+        Создает задания для оплаченных, но не доставленных платежей без задания.
+
+        Платежи проходят в личном чате, поэтому отчет отправляется в чат
+        с ID пользователя.
+
+        Возвращает:
+            int: Число созданных заданий
+        """
+        async with async_session() as session:
+            rows = (await session.execute(
+                select(Payment.provider_payment_id, Payment.user_id)
+                .where(
+                    Payment.file_id.is_(None),
+                    Payment.provider_payment_id.is_not(None),
+                    ~exists().where(ReportJob.provider_payment_id == Payment.provider_payment_id),
+                )
+            )).all()
+
+            created = 0
+            for provider_payment_id, user_id in rows:
+                created += await self.enqueue(
+                    session, provider_payment_id, user_id, f"ID платежа: {provider_payment_id}"
+                )
+        return created
+
+    def _ready_condition(self, now: datetime):
+        """
+        Задание готово к работе: ожидает и его время пришло, или зависло в работе.
+        """
+        return or_(
+            and_(ReportJob.status == JOB_PENDING, ReportJob.available_at <= now),
+            and_(
+                ReportJob.status == JOB_RUNNING,
+                ReportJob.started_at < now - timedelta(seconds=self.stale_after),
+            ),
+        )
+
+    async def _claim(self, limit: int) -> List[ReportJob]:
+        """
+        Забирает в работу до limit готовых заданий.
+        """
+        now = utcnow()
+        async with async_session() as session:
+            candidates = (await session.execute(
+                select(ReportJob.id)
+                .where(self._ready_condition(now))
+                .order_by(ReportJob.id)
+                .limit(limit)
+            )).scalars().all()
+
+            claimed = []
+            for job_id in candidates:
+                # Условный UPDATE: задание, уже взятое другой репликой, пропускается
+                result = await session.execute(
+                    update(ReportJob)
+                    .where(ReportJob.id == job_id, self._ready_condition(now))
+                    .values(status=JOB_RUNNING, started_at=now, attempts=ReportJob.attempts + 1)
+                )
+                if result.rowcount == 1:
+                    claimed.append(job_id)
+            await session.commit()
+
+            if not claimed:
+                return []
+            return list((await session.execute(
+                select(ReportJob).where(ReportJob.id.in_(claimed)).order_by(ReportJob.id)
+            )).scalars())
+
+    async def _update_owned(self, job: ReportJob, lease: asyncio.Lock, **values) -> bool:
+        """
+        UPDATE задания, только пока оно в работе у этой реплики.
+
+        Реплика, перехватившая зависшее задание, записывает в started_at
+        свое время, и прежний владелец больше не может ни продлить, ни
+        завершить задание.
+
+        Возвращает:
+            bool: True, если задание обновлено
+        """
+        async with lease:
+            async with async_session() as session:
+                result = await session.execute(
+                    update(ReportJob)
+                    .where(
+                        ReportJob.id == job.id,
+                        ReportJob.status == JOB_RUNNING,
+                        ReportJob.started_at == job.started_at,
+                    )
+                    .values(**values)
+                )
+                await session.commit()
+            owned = result.rowcount == 1
+            if owned and 'started_at' in values:
+                job.started_at = values['started_at']
+        return owned
+
+    async def _extend_lease(self, job: ReportJob, lease: asyncio.Lock) -> None:
+        """
+        Продлевает аренду задания каждую треть stale_after, чтобы долгое
+        задание (очередь пула, TelegramRetryAfter) не считалось зависшим.
+        """
+        while True:
+            await asyncio.sleep(max(1.0, self.stale_after / 3))
+            try:
+                if not await self._update_owned(job, lease, started_at=utcnow()):
+                    return
+            except Exception:
+                logger.exception("Не удалось продлить аренду задания %s", job.id)
+
+    async def _process(self, job: ReportJob) -> None:
+        """
+        Выполняет задание: отправляет сохраненный file_id или генерирует отчет.
+        """
+        lease = asyncio.Lock()
+        heartbeat = asyncio.create_task(self._extend_lease(job, lease))
+        document = None
+        try:
+            async with async_session() as session:
+                file_id = await get_file_id_for_provider(session, job.provider_payment_id)
+                await session.commit()
+
+                if file_id:
+                    await send_documents(
+                        self._bot, job.chat_id,
+                        [(job.provider_payment_id, file_id, job.receipt_text)],
+                        source="file_id",
+                    )
+                else:
+                    document = await get_payment_document(job.provider_payment_id, PRIORITY_FRESH, owner=job.chat_id)
+                    docx = BufferedInputFile(document, filename=f"{job.provider_payment_id}.docx")
+                    sent_messages = await send_documents(
+                        self._bot, job.chat_id,
+                        [(job.provider_payment_id, docx, job.receipt_text)],
+                        source="upload",
+                    )
+                    file_id = sent_messages[0].document.file_id
+                    artifact_store.mark_used(document)
+                    await set_file_id_for_provider(session, job.provider_payment_id, file_id)
+
+            finished = utcnow()
+            if await self._update_owned(job, lease, status=JOB_DONE, finished_at=finished, last_error=None):
+                PAYMENT_DELIVERY.observe((finished - job.created_at).total_seconds())
+            else:
+                logger.warning("Задание %s перехвачено другой репликой", job.id)
+
+        except Exception as e:
+            logger.exception("Не удалось выполнить задание %s", job.id)
+            if document is not None:
+                artifact_store.release(document)
+            await self._fail(job, lease, e)
+        finally:
+            heartbeat.cancel()
+
+    async def _fail(self, job: ReportJob, lease: asyncio.Lock, error: Exception) -> None:
+        """
+        Возвращает задание в очередь с задержкой или помечает его неудачным.
+        """
+        now = utcnow()
+        failed = job.attempts >= self.max_attempts
+        owned = await self._update_owned(
+            job, lease,
+            status=JOB_FAILED if failed else JOB_PENDING,
+            last_error=str(error)[:1024],
+            available_at=now + timedelta(seconds=self.retry_delay * job.attempts),
+            finished_at=now if failed else None,
+        )
+        if not owned:
+            logger.warning("Задание %s перехвачено другой репликой", job.id)
+            return
+
+        if failed:
+            try:
+                await self._bot.send_message(job.chat_id, f"❌ Ошибка при отправке файла: {str(error)}")
+            except Exception:
+                logger.exception("Не удалось сообщить об ошибке задания %s", job.id)
+
+    async def _run(self) -> None:
+        """
+        Основной цикл: в работе держится до concurrency заданий, и новое
+        задание забирается, как только освобождается место, не дожидаясь
+        остальных. В ожидании цикл просыпается по завершении задания, новому
+        заданию или по интервалу опроса БД.
+        """
+        try:
+            while True:
+                self._wakeup.clear()
+                free = self.concurrency - len(self._running)
+                jobs: List[ReportJob] = []
+                if free:
+                    try:
+                        jobs = await self._claim(free)
+                    except Exception:
+                        logger.exception("Не удалось получить задания")
+
+                for job in jobs:
+                    task = asyncio.create_task(self._process(job))
+                    self._running.add(task)
+                    task.add_done_callback(self._running.discard)
+
+                wakeup = asyncio.create_task(self._wakeup.wait())
+                try:
+                    await asyncio.wait(
+                        {wakeup, *self._running},
+                        timeout=self.poll_interval,
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                finally:
+                    wakeup.cancel()
+        finally:
+            for task in self._running:
+                task.cancel()
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def start(self, bot: Bot) -> None:
+        """
+        Создает задания для недоставленных платежей и запускает воркер.
+        """
+        if self._task is not None:
+            return
+        self._bot = bot
+
+        created = await self.redrive()
+        if created:
+            logger.info("Поставлено заданий для недоставленных платежей: %d", created)
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """
+        Останавливает воркер и задания в работе; незавершенные задания
+        будут взяты в работу снова.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+# Общий воркер заданий
+report_jobs = ReportJobs(
+    settings.JOBS_CONCURRENCY,
+    settings.JOBS_MAX_ATTEMPTS,
+    settings.JOBS_POLL_INTERVAL,
+    settings.JOBS_RETRY_DELAY,
+    settings.JOBS_STALE_AFTER,
+)
@@ -1,13 +1,78 @@
 """
-Точка входа приложения: инициализация БД и запуск бота.
+Точка входа приложения: инициализация БД и запуск бота
+в режиме long polling или webhook.
 """
 from aiogram import Dispatcher, Bot
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 import asyncio
+import signal
 
 from settings import settings
-from models import init_db
+from models import async_session, init_db
+from middlewares import DbSessionMiddleware, UpdateLimitMiddleware
 from admin import router_admin
 from user import router_user
+from stock import report_stock
+from jobs import report_jobs
+from workers import report_pool
+from telemetry import metrics_server
+from artifacts import artifact_store
+
+
+async def run_webhook(bot: Bot, dispatcher: Dispatcher) -> None:
+    """
+    Запуск aiohttp-сервера, принимающего обновления по webhook.
+
+    Работает до SIGINT/SIGTERM. При остановке сервер перестает принимать
+    запросы, затем ждет завершения уже принятых обновлений
+    (не дольше WEBHOOK_SHUTDOWN_TIMEOUT).
+
+    Args:
+        bot: Экземпляр бота
+        dispatcher: Диспетчер с подключенными роутерами
+    """
+    # Ограничение одновременно обрабатываемых обновлений
+    update_limit = UpdateLimitMiddleware(settings.WEBHOOK_MAX_UPDATES)
+    dispatcher.update.outer_middleware(update_limit)
+
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        secret_token=settings.WEBHOOK_SECRET or None,
+    ).register(app, path=settings.WEBHOOK_PATH)
+    setup_application(app, dispatcher, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT)
+    await site.start()
+
+    # Регистрация webhook в Telegram; без WEBHOOK_URL сервер только
+    # принимает запросы (например, за прокси или для локальной проверки)
+    if settings.WEBHOOK_URL:
+        await bot.set_webhook(
+            url=settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH,
+            secret_token=settings.WEBHOOK_SECRET or None,
+            allowed_updates=dispatcher.resolve_used_update_types(),
+        )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows: остановка по KeyboardInterrupt
+            pass
+
+    try:
+        await stop.wait()
+    finally:
+        await site.stop()
+        await update_limit.wait_idle(settings.WEBHOOK_SHUTDOWN_TIMEOUT)
+        await runner.cleanup()
 
 
 async def main() -> None:
@@ -21,12 +86,34 @@ async def main() -> None:
     bot = Bot(token=settings.BOT_TOKEN)
     dispatcher = Dispatcher()
     
+    # Одна сессия БД на обновление
+    dispatcher.update.middleware(DbSessionMiddleware(async_session))
+    
     # Подключение роутеров
     dispatcher.include_router(router_admin)
     dispatcher.include_router(router_user)
     
+    # Фоновое пополнение запаса готовых отчетов
+    await report_stock.start()
+    
+    # Воркер заданий на доставку отчетов (подхватывает недоставленные после перезапуска)
+    await report_jobs.start(bot)
+    
+    # HTTP-эндпоинт метрик (если задан METRICS_PORT)
+    await metrics_server.start()
+    
     # Запуск бота
-    await dispatcher.start_polling(bot)
+    try:
+        if settings.BOT_MODE == "webhook":
+            await run_webhook(bot, dispatcher)
+        else:
+            await dispatcher.start_polling(bot)
+    finally:
+        await metrics_server.close()
+        await report_jobs.close()
+        await report_stock.close()
+        await report_pool.close()
+        artifact_store.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,403 @@
+"""
+Обучение моделей и кэш результатов по параметрам разбиения выборки.
+"""
+import math
+import os
+from dataclasses import dataclass
+from typing import Callable, Optional, Set, Tuple
+
+import numpy as np
+# Оценщики sklearn импортирует только fit_models; быстрым движкам нужно
+# лишь KD-дерево, дающее тот же порядок равноудаленных соседей
+from sklearn.neighbors import KDTree
+
+from cache import LRUCache
+from dataset import FEATURE_COLUMNS, TARGET_COLUMN, get_dataset, get_statistics
+from settings import settings
+from stats import Moments
+
+
+@dataclass(frozen=True)
+class ModelResult:
+    """
+    Результат одной модели на тестовой выборке.
+
+    Атрибуты:
+        rmse: Строка с RMSE для вставки в документ
+        r2: Строка с R2 для вставки в документ
+        y_pred: Предсказанные значения
+    """
+    rmse: str
+    r2: str
+    y_pred: np.ndarray
+
+
+@dataclass(frozen=True)
+class ModelingResults:
+    """
+    Результаты моделирования для пары (test_size, random_state).
+
+    Атрибуты:
+        train_size: Размер обучающей выборки
+        test_size: Размер тестовой выборки
+        y_test: Истинные значения тестовой выборки
+        linear: Результат линейной регрессии
+        knn: Результат метода k-ближайших соседей
+    """
+    train_size: int
+    test_size: int
+    y_test: np.ndarray
+    linear: ModelResult
+    knn: ModelResult
+
+
+# Кэш результатов в памяти процесса: (test_size, random_state) -> ModelingResults
+results_cache = LRUCache(settings.MODEL_CACHE_SIZE)
+
+
+def _build_results(
+    train_size: int,
+    y_test: np.ndarray,
+    linear_pred: np.ndarray,
+    knn_pred: np.ndarray,
+    rmse: Callable[[np.ndarray, np.ndarray], float],
+    r2: Callable[[np.ndarray, np.ndarray], float]
+) -> ModelingResults:
+    """
+    Сборка результатов с метриками в формате, который вставляется в документ.
+    """
+    return ModelingResults(
+        train_size=train_size,
+        test_size=y_test.shape[0],
+        y_test=y_test,
+        linear=ModelResult(
+            rmse=f'Root Mean Squared Error (RMSE): {rmse(y_test, linear_pred)}',
+            r2=f'R2: {np.round(r2(y_test, linear_pred), 2)}',
+            y_pred=linear_pred,
+        ),
+        knn=ModelResult(
+            rmse=f'Root Mean Squared Error (RMSE): {np.round(rmse(y_test, knn_pred), 2)}',
+            r2=f'R2: {np.round(r2(y_test, knn_pred), 2)}',
+            y_pred=knn_pred,
+        ),
+    )
+
+
+def fit_models(test_size: float, random_state: int) -> ModelingResults:
+    """
+    Разбиение выборки и обучение LinearRegression и KNeighborsRegressor.
+
+    Аргументы:
+        test_size: Доля тестовой выборки
+        random_state: Seed для воспроизводимости
+
+    Возвращает:
+        ModelingResults: Размеры выборок, метрики и предсказания
+    """
+    from sklearn import metrics
+    from sklearn.linear_model import LinearRegression
+    from sklearn.model_selection import train_test_split
+    from sklearn.neighbors import KNeighborsRegressor
+
+    dataset = get_dataset()
+    X_train, X_test, y_train, y_test = train_test_split(
+        dataset.features,
+        dataset.target,
+        test_size=test_size,
+        random_state=random_state,
+    )
+
+    model = LinearRegression()
+    model.fit(X_train, y_train)
+    linear_pred = model.predict(X_test)
+
+    model = KNeighborsRegressor()
+    model.fit(X_train, y_train)
+    knn_pred = model.predict(X_test)
+
+    return _build_results(
+        X_train.shape[0],
+        y_test,
+        linear_pred,
+        knn_pred,
+        rmse=lambda y_true, y_pred: np.sqrt(metrics.mean_squared_error(y_true, y_pred)),
+        r2=metrics.r2_score,
+    )
+
+
+def _split_indices(n_samples: int, test_size: float, random_state: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Индексы train/test, совпадающие с train_test_split(shuffle=True).
+    """
+    n_test = math.ceil(test_size * n_samples)
+    permutation = np.random.RandomState(random_state).permutation(n_samples)
+    return permutation[n_test:], permutation[:n_test]
+
+
+def _linear_predict(X_train: np.ndarray, y_train: np.ndarray, X_test: np.ndarray) -> np.ndarray:
+    """
+    Линейная регрессия методом наименьших квадратов на центрированных данных,
+    как в LinearRegression (тот же драйвер LAPACK gelsd).
+    """
+    X = X_train.astype(np.float64)
+    X_offset = X.mean(axis=0)
+    y_offset = y_train.mean()
+    coef = np.linalg.lstsq(X - X_offset, y_train - y_offset, rcond=None)[0]
+    return X_test.astype(np.float64) @ coef + (y_offset - X_offset @ coef)
+
+
+def _knn_predict(
+    X_train: np.ndarray,
+    y_train: np.ndarray,
+    X_test: np.ndarray,
+    n_neighbors: int = 5
+) -> np.ndarray:
+    """
+    Регрессия k-ближайших соседей с равными весами.
+
+    Признаки целочисленные и сильно повторяются, поэтому выбор соседей при
+    равных расстояниях определяется устройством дерева. Используется то же
+    KD-дерево, что строит KNeighborsRegressor (leaf_size=30), но запрос
+    выполняется только по уникальным строкам тестовой выборки.
+    """
+    tree = KDTree(X_train, leaf_size=30, metric='euclidean')
+    rows, inverse = np.unique(X_test, axis=0, return_inverse=True)
+    neighbors = tree.query(rows, k=n_neighbors, return_distance=False)
+    return y_train[neighbors].mean(axis=1)[inverse.ravel()]
+
+
+def _rmse(y_true: np.ndarray, y_pred: np.ndarray) -> float:
+    """
+    Корень среднеквадратической ошибки (как metrics.mean_squared_error).
+    """
+    return np.sqrt(np.average((y_true - y_pred)[:, np.newaxis] ** 2, axis=0).mean())
+
+
+def _r2(y_true: np.ndarray, y_pred: np.ndarray) -> float:
+    """
+    Коэффициент детерминации (как metrics.r2_score).
+    """
+    numerator = ((y_true - y_pred) ** 2).sum()
+    denominator = ((y_true - y_true.mean()) ** 2).sum()
+    return 1 - numerator / denominator
+
+
+def fit_models_fast(test_size: float, random_state: int) -> ModelingResults:
+    """
+    Быстрый движок: те же результаты, что у fit_models, без оценщиков sklearn.
+
+    Разбиение, линейная регрессия и метрики считаются напрямую в NumPy,
+    kNN — запросами к KD-дереву по уникальным строкам.
+
+    Аргументы:
+        test_size: Доля тестовой выборки
+        random_state: Seed для воспроизводимости
+
+    Возвращает:
+        ModelingResults: Размеры выборок, метрики и предсказания
+    """
+    dataset = get_dataset()
+    train_index, test_index = _split_indices(
+        dataset.features.shape[0], test_size, random_state
+    )
+    X_train = dataset.features[train_index]
+    X_test = dataset.features[test_index]
+    y_train = dataset.target[train_index]
+    y_test = dataset.target[test_index]
+
+    return _build_results(
+        X_train.shape[0],
+        y_test,
+        _linear_predict(X_train, y_train, X_test),
+        _knn_predict(X_train, y_train, X_test),
+        rmse=_rmse,
+        r2=_r2,
+    )
+
+
+# Столбцы статистики для линейной модели: признаки и целевая переменная
+MODEL_COLUMNS = FEATURE_COLUMNS + [TARGET_COLUMN]
+
+
+def _normal_equations_predict(total: Moments, X_test: np.ndarray, y_test: np.ndarray) -> np.ndarray:
+    """
+    Линейная регрессия по нормальным уравнениям: статистика обучающей
+    выборки — общая статистика total за вычетом тестовых строк.
+    """
+    train = total.subtract(Moments.from_array(MODEL_COLUMNS, np.column_stack([X_test, y_test])))
+    coef, intercept = train.solve(FEATURE_COLUMNS, TARGET_COLUMN)
+    return X_test.astype(np.float64) @ coef + intercept
+
+
+def fit_models_incremental(test_size: float, random_state: int) -> ModelingResults:
+    """
+    Инкрементальный движок: линейная регрессия по нормальным уравнениям
+    из статистики датасета, kNN — как в быстром движке.
+
+    Статистика обучающей выборки получается вычитанием статистики тестовых
+    строк из общей (get_statistics), поэтому линейная модель обходит только
+    тестовую выборку. Коэффициенты совпадают с LinearRegression с точностью
+    до ошибок округления, но RMSE линейной модели выводится без округления
+    и может отличаться в последних знаках; допуск проверяет
+    bench/parity.py --engine incremental.
+
+    Аргументы:
+        test_size: Доля тестовой выборки
+        random_state: Seed для воспроизводимости
+
+    Возвращает:
+        ModelingResults: Размеры выборок, метрики и предсказания
+    """
+    dataset = get_dataset()
+    n_samples = dataset.features.shape[0]
+    train_index, test_index = _split_indices(n_samples, test_size, random_state)
+    X_train = dataset.features[train_index]
+    X_test = dataset.features[test_index]
+    y_train = dataset.target[train_index]
+    y_test = dataset.target[test_index]
+
+    statistics = get_statistics()
+    total = statistics.moments.select(MODEL_COLUMNS)
+    if statistics.key != dataset.key or total.count != n_samples:
+        # Статистика построена по другой версии файла или без строк с пропусками
+        total = Moments.from_array(MODEL_COLUMNS, np.column_stack([dataset.features, dataset.target]))
+
+    return _build_results(
+        X_train.shape[0],
+        y_test,
+        _normal_equations_predict(total, X_test, y_test),
+        _knn_predict(X_train, y_train, X_test),
+        rmse=_rmse,
+        r2=_r2,
+    )
+
+
+# Движки обучения моделей, выбираются настройкой MODEL_ENGINE
+ENGINES = {
+    'sklearn': fit_models,
+    'fast': fit_models_fast,
+    'incremental': fit_models_incremental,
+}
+
+
+def _results_path(key: str, test_size: float, random_state: int) -> str:
+    """
+    Путь к файлу сохраненных результатов в MODEL_CACHE_DIR.
+
+    key — ключ загруженного датасета (Dataset.key), а не текущего файла:
+    результаты считаются по данным процесса. Движки дают метрики,
+    различающиеся в последних знаках, поэтому MODEL_ENGINE входит в ключ.
+    """
+    return os.path.join(
+        settings.MODEL_CACHE_DIR,
+        f"models.{key}.{settings.MODEL_ENGINE}.{test_size:g}.{random_state}.npz"
+    )
+
+
+# Ключи датасета, для которых результаты других версий уже удалены
+_pruned: Set[str] = set()
+
+
+def _prune_results(key: str) -> None:
+    """
+    Удаляет из MODEL_CACHE_DIR результаты других версий датасета.
+
+    Новая версия датасета никогда не получает прежний ключ, поэтому такие
+    файлы больше не читаются. В каталоге остаются результаты одной версии:
+    не больше одного файла на пару (test_size, random_state) и движок,
+    около 4 тысяч файлов и 90 МБ на движок.
+    """
+    if key in _pruned:
+        return
+    _pruned.add(key)
+    try:
+        filenames = os.listdir(settings.MODEL_CACHE_DIR)
+    except OSError:
+        return
+    for filename in filenames:
+        if filename.startswith('models.') and not filename.startswith(f'models.{key}.'):
+            try:
+                os.remove(os.path.join(settings.MODEL_CACHE_DIR, filename))
+            except OSError:
+                pass
+
+
+def _load_results(path: str) -> Optional[ModelingResults]:
+    """
+    Чтение результатов из .npz-файла. Возвращает None, если файла нет.
+    """
+    try:
+        with np.load(path) as data:
+            return ModelingResults(
+                train_size=int(data['train_size']),
+                test_size=int(data['test_size']),
+                y_test=data['y_test'],
+                linear=ModelResult(
+                    rmse=str(data['linear_rmse']),
+                    r2=str(data['linear_r2']),
+                    y_pred=data['linear_pred'],
+                ),
+                knn=ModelResult(
+                    rmse=str(data['knn_rmse']),
+                    r2=str(data['knn_r2']),
+                    y_pred=data['knn_pred'],
+                ),
+            )
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _save_results(path: str, results: ModelingResults) -> None:
+    """
+    Атомарная запись результатов в .npz-файл.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(
+            f,
+            train_size=results.train_size,
+            test_size=results.test_size,
+            y_test=results.y_test,
+            linear_rmse=results.linear.rmse,
+            linear_r2=results.linear.r2,
+            linear_pred=results.linear.y_pred,
+            knn_rmse=results.knn.rmse,
+            knn_r2=results.knn.r2,
+            knn_pred=results.knn.y_pred,
+        )
+    os.replace(tmp_path, path)
+
+
+def get_modeling_results(test_size: float, random_state: int) -> ModelingResults:
+    """
+    Возвращает результаты моделирования, обучая модели только при промахе кэша.
+
+    Сначала проверяется LRU-кэш процесса, затем каталог MODEL_CACHE_DIR
+    (если задан), и только после этого модели обучаются движком MODEL_ENGINE.
+
+    Аргументы:
+        test_size: Доля тестовой выборки
+        random_state: Seed для воспроизводимости
+
+    Возвращает:
+        ModelingResults: Размеры выборок, метрики и предсказания
+    """
+    key = (test_size, random_state)
+    results = results_cache.get(key)
+    if results is not None:
+        return results
+
+    version = get_dataset().key
+    path = _results_path(version, test_size, random_state) if settings.MODEL_CACHE_DIR else None
+    if path is not None:
+        results = _load_results(path)
+
+    if results is None:
+        results = ENGINES[settings.MODEL_ENGINE](test_size, random_state)
+        if path is not None:
+            _prune_results(version)
+            _save_results(path, results)
+
+    results_cache.set(key, results)
+    return results
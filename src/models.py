@@ -1,7 +1,8 @@
 """
 Модели SQLAlchemy: платежи и инициализация БД.
 """
-from typing import Optional
+from datetime import datetime
+from typing import Any, Dict, Optional
 from sqlalchemy.ext.asyncio import (
     AsyncAttrs,
     create_async_engine,
@@ -9,15 +10,61 @@ from sqlalchemy.ext.asyncio import (
     AsyncSession
 )
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import String, Integer
+from sqlalchemy import BigInteger, DateTime, Index, String, Integer, event, insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError
 from settings import settings
 
 
 # Конфигурация базы данных из настроек
 DATABASE_URL = settings.DATABASE_URL
 
+# PRAGMA для каждого нового соединения SQLite: WAL позволяет читать
+# во время записи, NORMAL в WAL-режиме безопасен и не ждет fsync на каждый коммит
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def _engine_options(url: str) -> Dict[str, Any]:
+    """
+    Параметры пула соединений для движка.
+
+    Для SQLite в памяти используется StaticPool с единственным соединением,
+    поэтому размеры пула к нему не применяются.
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_pre_ping": parsed.get_backend_name() != "sqlite",
+    }
+
+
 # Инициализация асинхронного движка SQLAlchemy
-engine = create_async_engine(DATABASE_URL)
+engine = create_async_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """
+    Настраивает новое соединение SQLite.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
 
 # Создание фабрики асинхронных сессий
 async_session = async_sessionmaker(
@@ -34,15 +81,21 @@ class Base(AsyncAttrs, DeclarativeBase):
 class Payment(Base):
     """
     Модель для хранения информации о платежах.
+
+    Составной индекс (user_id, id) обслуживает постраничную выборку заказов
+    пользователя: фильтр по user_id и порядок по id берутся из индекса.
     
     Атрибуты:
         id: Уникальный идентификатор записи
-        user_id: ID пользователя (индексируется)
+        user_id: ID пользователя
         username: Username пользователя в Telegram (опционально)
         provider_payment_id: Идентификатор платежа у банка/провайдера
         file_id: ID привязанного файла (опционально)
     """
     __tablename__ = "payments"
+    __table_args__ = (
+        Index("ix_payments_user_id_id", "user_id", "id"),
+    )
 
     id: Mapped[int] = mapped_column(
         primary_key=True,
@@ -50,7 +103,6 @@ class Payment(Base):
     )
     user_id: Mapped[int] = mapped_column(
         Integer,
-        index=True,
         doc="ID пользователя"
     )
     username: Mapped[Optional[str]] = mapped_column(
@@ -71,9 +123,144 @@ class Payment(Base):
     )
 
 
+# Статусы заданий на генерацию и доставку отчета
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class ReportJob(Base):
+    """
+    Задание на генерацию и доставку отчета по оплаченному платежу.
+
+    Хранится в БД, поэтому переживает перезапуск процесса: воркер заданий
+    забирает их в работу и повторяет неудачные попытки.
+    
+    Атрибуты:
+        id: Уникальный идентификатор задания
+        provider_payment_id: ID платежа (одно задание на платеж)
+        chat_id: ID чата, в который отправляется отчет
+        receipt_text: Подпись к документу
+        status: pending, running, done или failed
+        attempts: Число начатых попыток
+        last_error: Текст последней ошибки
+        created_at: Время создания задания (UTC)
+        available_at: Время, раньше которого задание не берется в работу (UTC)
+        started_at: Начало последней попытки (UTC)
+        finished_at: Время завершения задания (UTC)
+    """
+    __tablename__ = "report_jobs"
+
+    id: Mapped[int] = mapped_column(
+        primary_key=True,
+        autoincrement=True
+    )
+    provider_payment_id: Mapped[str] = mapped_column(
+        String(128),
+        unique=True,
+        doc="ID платежа у провайдера/банка"
+    )
+    chat_id: Mapped[int] = mapped_column(
+        BigInteger,
+        doc="ID чата для доставки"
+    )
+    receipt_text: Mapped[str] = mapped_column(
+        String(1024),
+        default="",
+        doc="Подпись к документу"
+    )
+    status: Mapped[str] = mapped_column(
+        String(16),
+        default=JOB_PENDING,
+        index=True,
+        doc="Статус задания"
+    )
+    attempts: Mapped[int] = mapped_column(
+        Integer,
+        default=0,
+        doc="Число попыток"
+    )
+    last_error: Mapped[Optional[str]] = mapped_column(
+        String(1024),
+        nullable=True,
+        doc="Последняя ошибка"
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        doc="Время создания"
+    )
+    available_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        doc="Не брать в работу раньше этого времени"
+    )
+    started_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime,
+        nullable=True,
+        doc="Начало последней попытки"
+    )
+    finished_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime,
+        nullable=True,
+        doc="Время завершения"
+    )
+
+
+async def insert_or_ignore(
+    session: AsyncSession,
+    model: type,
+    values: Dict[str, Any],
+    conflict_column: Any
+) -> bool:
+    """
+    Вставляет строку и фиксирует транзакцию, пропуская строку при конфликте
+    по уникальному столбцу.
+
+    ON CONFLICT DO NOTHING для SQLite и PostgreSQL, INSERT IGNORE для
+    MySQL/MariaDB; для прочих СУБД — обычная вставка с перехватом
+    IntegrityError.
+    
+    Возвращает:
+        bool: True, если строка добавлена, False — если она уже существовала
+    """
+    dialect_name = session.bind.dialect.name
+    if dialect_name == "sqlite":
+        statement = sqlite_insert(model).values(**values).on_conflict_do_nothing(
+            index_elements=[conflict_column]
+        )
+    elif dialect_name == "postgresql":
+        statement = postgresql_insert(model).values(**values).on_conflict_do_nothing(
+            index_elements=[conflict_column]
+        )
+    elif dialect_name in ("mysql", "mariadb"):
+        statement = insert(model).values(**values).prefix_with("IGNORE")
+    else:
+        try:
+            session.add(model(**values))
+            await session.commit()
+            return True
+        except IntegrityError:
+            await session.rollback()
+            return False
+
+    result = await session.execute(statement)
+    await session.commit()
+    return result.rowcount == 1
+
+
 async def init_db() -> None:
     """
     Инициализирует базу данных, создавая все таблицы.
+
+    create_all не добавляет индексы к уже существующим таблицам,
+    поэтому недостающие индексы создаются отдельно.
     """
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_create_missing_indexes)
+
+
+def _create_missing_indexes(connection) -> None:
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
\ No newline at end of file
@@ -1,9 +1,20 @@
 """
 Утилиты для платежей: цена, кэш file_id, выборка заказов.
+
+Функции работают в сессии обновления, которую передает DbSessionMiddleware.
 """
-from typing import Optional, List
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Optional, List, Sequence
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from cache import LRUCache
 from settings import settings
-from models import async_session, Payment
+from models import Payment, insert_or_ignore
+from telemetry import DB_QUERY, FILE_ID_LRU
+
+
+# Кэш file_id в памяти процесса: provider_payment_id -> file_id.
+# file_id после записи не меняется, поэтому хранятся только найденные значения
+file_id_cache = LRUCache(settings.FILE_ID_CACHE_SIZE, ttl=settings.FILE_ID_CACHE_TTL)
 
 
 def get_price_rub() -> int:
@@ -13,42 +24,223 @@ def get_price_rub() -> int:
     return int(settings.PRICE_RUB)
 
 
-async def set_file_id_for_provider(provider_payment_id: str, file_id: str) -> None:
+async def add_payment(
+    session: AsyncSession,
+    user_id: int,
+    username: Optional[str],
+    provider_payment_id: str,
+) -> bool:
+    """
+    Сохраняет успешный платеж, если его еще нет.
+
+    Вставка идет через INSERT ... ON CONFLICT DO NOTHING по уникальному
+    provider_payment_id (INSERT IGNORE для MySQL), поэтому повторная
+    доставка successful_payment не создает дубликат и не падает.
+
+    Returns:
+        bool: True, если платеж добавлен, False — если он уже был сохранен
+    """
+    values = dict(
+        user_id=user_id,
+        username=username,
+        provider_payment_id=provider_payment_id,
+    )
+    with DB_QUERY.time(query="add_payment"):
+        return await insert_or_ignore(session, Payment, values, Payment.provider_payment_id)
+
+
+def get_cached_file_id(provider_payment_id: str) -> Optional[str]:
+    """
+    Возвращает file_id из кэша процесса без обращения к БД
+    """
+    file_id = file_id_cache.get(provider_payment_id)
+    FILE_ID_LRU.inc(result="hit" if file_id else "miss")
+    return file_id
+
+
+def _remember_file_ids(rows: Iterable[dict]) -> None:
+    """
+    Заполняет кэш file_id из прочитанных записей платежей
+    """
+    for row in rows:
+        if row["file_id"]:
+            file_id_cache.set(row["provider_payment_id"], row["file_id"])
+
+
+async def get_payment(session: AsyncSession, provider_payment_id: str) -> Optional[dict]:
+    """
+    Возвращает запись платежа (включая file_id) или None
+    """
+    with DB_QUERY.time(query="get_payment"):
+        result = await session.execute(
+            Payment.__table__.select()
+            .where(Payment.provider_payment_id == provider_payment_id)
+            .limit(1)
+        )
+        row = result.mappings().first()
+    if row:
+        _remember_file_ids((row,))
+    return row
+
+
+async def set_file_id_for_provider(
+    session: AsyncSession,
+    provider_payment_id: str,
+    file_id: str,
+) -> None:
     """
     Привязывает file_id к платежу
     """
-    async with async_session() as session:
+    with DB_QUERY.time(query="set_file_id"):
         await session.execute(
             Payment.__table__.update()
             .where(Payment.provider_payment_id == provider_payment_id)
             .values(file_id=file_id)
         )
         await session.commit()
+    file_id_cache.set(provider_payment_id, file_id)
 
 
-async def get_file_id_for_provider(provider_payment_id: str) -> Optional[str]:
+async def get_file_id_for_provider(session: AsyncSession, provider_payment_id: str) -> Optional[str]:
     """
-    Возвращает file_id для платежа
+    Возвращает file_id для платежа, сначала из кэша процесса
     """
-    async with async_session() as session:
-        result = await session.execute(
-            Payment.__table__.select()
-            .where(Payment.provider_payment_id == provider_payment_id)
-            .limit(1)
+    file_id = get_cached_file_id(provider_payment_id)
+    if file_id:
+        return file_id
+    row = await get_payment(session, provider_payment_id)
+    return row["file_id"] if row else None
+
+
+async def list_successful_payments(
+    session: AsyncSession,
+    user_id: int,
+    after_id: Optional[int] = None,
+    limit: int = settings.PAYMENTS_PAGE_SIZE,
+) -> List[dict]:
+    """
+    Возвращает страницу успешных платежей пользователя, от новых к старым.
+
+    Keyset-пагинация: следующая страница запрашивается с after_id, равным
+    id последней записи предыдущей страницы, поэтому запрос не зависит
+    от номера страницы и идет по индексу (user_id, id).
+
+    Returns:
+        List[dict]: Записи с id, provider_payment_id и file_id
+    """
+    query = (
+        select(Payment.id, Payment.provider_payment_id, Payment.file_id)
+        .where(Payment.user_id == user_id)
+        .order_by(Payment.id.desc())
+        .limit(limit)
+    )
+    if after_id is not None:
+        query = query.where(Payment.id < after_id)
+
+    with DB_QUERY.time(query="list_payments"):
+        result = await session.execute(query)
+        rows = list(result.mappings())
+    # Прогрев кэша: повторные выдачи этих заказов не пойдут в БД
+    _remember_file_ids(rows)
+    return rows
+
+
+async def iter_successful_payments(
+    session: AsyncSession,
+    user_id: int,
+    page_size: int = settings.PAYMENTS_PAGE_SIZE,
+) -> AsyncIterator[List[dict]]:
+    """
+    Отдает успешные платежи пользователя страницами по page_size записей
+    """
+    async for page in _iter_pages(
+        lambda after_id: list_successful_payments(session, user_id, after_id, page_size),
+        page_size,
+    ):
+        yield page
+
+
+async def list_payments_without_file(
+    session: AsyncSession,
+    after_id: Optional[int] = None,
+    limit: int = settings.PAYMENTS_PAGE_SIZE,
+) -> List[dict]:
+    """
+    Возвращает страницу платежей без привязанного file_id, от старых к новым.
+
+    Returns:
+        List[dict]: Записи с id, provider_payment_id и file_id
+    """
+    query = (
+        select(Payment.id, Payment.provider_payment_id, Payment.file_id)
+        .where(Payment.file_id.is_(None), Payment.provider_payment_id.is_not(None))
+        .order_by(Payment.id)
+        .limit(limit)
+    )
+    if after_id is not None:
+        query = query.where(Payment.id > after_id)
+
+    with DB_QUERY.time(query="list_payments_without_file"):
+        result = await session.execute(query)
+        return list(result.mappings())
+
+
+async def count_payments_without_file(session: AsyncSession) -> int:
+    """
+    Количество платежей без привязанного file_id
+    """
+    with DB_QUERY.time(query="count_payments_without_file"):
+        return await session.scalar(
+            select(func.count())
+            .select_from(Payment)
+            .where(Payment.file_id.is_(None), Payment.provider_payment_id.is_not(None))
         )
-        row = result.mappings().first()
-        return row["file_id"] if row else None
 
 
-async def list_successful_payments(user_id: int) -> List[dict]:
+async def iter_payments_without_file(
+    session: AsyncSession,
+    page_size: int = settings.PAYMENTS_PAGE_SIZE,
+) -> AsyncIterator[List[dict]]:
+    """
+    Отдает платежи без file_id страницами по page_size записей
+    """
+    async for page in _iter_pages(
+        lambda after_id: list_payments_without_file(session, after_id, page_size),
+        page_size,
+    ):
+        yield page
+
+
+async def get_payments(session: AsyncSession, provider_payment_ids: Sequence[str]) -> List[dict]:
     """
-    Получает список успешных платежей пользователя
+    Возвращает найденные платежи по списку ID в порядке списка
+
+    Returns:
+        List[dict]: Записи с id, provider_payment_id и file_id
     """
-    async with async_session() as session:
+    with DB_QUERY.time(query="get_payments"):
         result = await session.execute(
-            Payment.__table__.select()
-            .where(Payment.user_id == user_id)
-            .order_by(Payment.id.desc())
+            select(Payment.id, Payment.provider_payment_id, Payment.file_id)
+            .where(Payment.provider_payment_id.in_(provider_payment_ids))
         )
-        rows = list(result.mappings())
-        return rows
\ No newline at end of file
+        rows = {row["provider_payment_id"]: row for row in result.mappings()}
+    _remember_file_ids(rows.values())
+    return [rows[i] for i in dict.fromkeys(provider_payment_ids) if i in rows]
+
+
+async def _iter_pages(
+    fetch: Callable[[Optional[int]], Awaitable[List[dict]]],
+    page_size: int,
+) -> AsyncIterator[List[dict]]:
+    """
+    Keyset-обход: следующая страница запрашивается по id последней записи
+    """
+    after_id = None
+    while True:
+        page = await fetch(after_id)
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        after_id = page[-1]["id"]
\ No newline at end of file
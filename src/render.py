@@ -0,0 +1,110 @@
+"""
+Рендер графиков отчета через объектный API matplotlib, без состояния pyplot.
+"""
+import io
+import threading
+
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+def _render_png(figure: Figure) -> bytes:
+    """
+    Сохранение фигуры в PNG в памяти.
+    """
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+def render_heatmap_png(corr_matrix: pd.DataFrame, colour_map: str) -> bytes:
+    """
+    Рендер тепловой карты корреляций в PNG.
+
+    Аргументы:
+        corr_matrix: Матрица корреляций
+        colour_map: Цветовая схема для визуализации
+
+    Возвращает:
+        bytes: Изображение в формате PNG
+    """
+    figure = Figure(figsize=(9, 6))
+    FigureCanvasAgg(figure)
+    sns.heatmap(corr_matrix, cmap=colour_map, annot=True, ax=figure.add_subplot())
+    return _render_png(figure)
+
+
+class PredictionPlot:
+    """
+    Шаблон графика "истинные vs предсказанные значения".
+
+    Фигура, оси, подписи и художники создаются один раз; для каждого
+    отчета обновляются только данные, подпись модели и легенда.
+    """
+
+    def __init__(self) -> None:
+        self.figure = Figure(figsize=(10, 8))
+        FigureCanvasAgg(self.figure)
+        self.axes = self.figure.add_subplot()
+        self.scatter = self.axes.scatter([], [])
+        (self.line,) = self.axes.plot([], [], label="True values", color="red")
+        self.axes.set_xlabel("Истинные значения")
+        self.axes.set_ylabel("Предсказанные значения")
+
+    def render(self, y_test: np.ndarray, y_pred: np.ndarray, model_name: str) -> bytes:
+        """
+        Рендер графика сравнения предсказанных и реальных значений в PNG.
+
+        Аргументы:
+            y_test: Реальные значения
+            y_pred: Предсказанные значения
+            model_name: Название модели для легенды
+
+        Возвращает:
+            bytes: Изображение в формате PNG
+        """
+        order = np.argsort(y_test)
+        y_test_ordered = y_test[order]
+        y_pred_ordered = y_pred[order]
+
+        self.scatter.set_offsets(np.column_stack([y_test_ordered, y_pred_ordered]))
+        self.scatter.set_label(model_name)
+        self.line.set_data(y_test_ordered, y_test_ordered)
+
+        # Пересчет границ осей только по новым данным
+        self.axes.ignore_existing_data_limits = True
+        self.axes.update_datalim(self.scatter.get_datalim(self.axes.transData).get_points())
+        self.axes.update_datalim(np.column_stack([y_test_ordered, y_test_ordered]))
+        self.axes.autoscale_view()
+        self.axes.legend()
+
+        return _render_png(self.figure)
+
+
+# Шаблоны графиков по потокам: фигура не должна использоваться параллельно
+_local = threading.local()
+
+
+def render_prediction_plot_png(
+    y_test: np.ndarray,
+    y_pred: np.ndarray,
+    model_name: str
+) -> bytes:
+    """
+    Рендер графика предсказаний через шаблон текущего потока.
+
+    Аргументы:
+        y_test: Реальные значения
+        y_pred: Предсказанные значения
+        model_name: Название модели для легенды
+
+    Возвращает:
+        bytes: Изображение в формате PNG
+    """
+    plot = getattr(_local, 'prediction_plot', None)
+    if plot is None:
+        plot = _local.prediction_plot = PredictionPlot()
+    return plot.render(y_test, y_pred, model_name)
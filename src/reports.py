@@ -0,0 +1,46 @@
+"""
+Генерация отчетов для процесса бота.
+
+Задания передаются в пул report_pool по имени функции, поэтому pandas,
+matplotlib, seaborn, sklearn и python-docx импортируются только
+в процессах-воркерах, а не при старте бота.
+"""
+from typing import Hashable, Optional
+
+from artifacts import artifact_store
+from telemetry import observe_stages
+from workers import PRIORITY_FRESH, report_pool
+
+# Точка входа пайплайна в процессе-воркере: "модуль:функция"
+RENDER_PROJECT = "backend:render_project_timed"
+
+
+async def get_project_document(priority: int = PRIORITY_FRESH, owner: Optional[Hashable] = None) -> bytes:
+    """
+    Основная функция для обработки данных, генерации визуализаций 
+    и создания итогового отчета в формате Word.
+
+    Выбирается еще не выданный вариант параметров; готовый отчет берется
+    из хранилища artifact_store, а при промахе генерируется в отдельном
+    процессе пула report_pool и сохраняется; при ошибке вариант освобождается.
+    Длительности этапов возвращаются из процесса-воркера и записываются
+    в метрики.
+    
+    Аргументы:
+        priority: Класс приоритета задания в пуле
+        owner: Владелец задания для ограничения на пользователя
+    
+    Возвращает:
+        bytes: Содержимое файла отчета (.docx)
+    """
+    variant = artifact_store.reserve()
+    try:
+        document = await artifact_store.get(variant)
+        if document is None:
+            document, timings = await report_pool.run(RENDER_PROJECT, variant, priority=priority, owner=owner)
+            observe_stages(timings)
+            await artifact_store.put(variant, document)
+    except BaseException:
+        artifact_store.cancel(variant)
+        raise
+    return document
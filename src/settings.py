@@ -1,6 +1,8 @@
 """
 Конфигурация приложения на pydantic-settings.
 """
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -13,6 +15,22 @@ class Settings(BaseSettings):
     BOT_TOKEN: str
     PROVIDER_TOKEN: str
     
+    # Режим получения обновлений: polling или webhook
+    BOT_MODE: Literal["polling", "webhook"] = "polling"
+
+    # Webhook: публичный URL (пусто — не регистрировать webhook в Telegram),
+    # путь, секрет заголовка X-Telegram-Bot-Api-Secret-Token и адрес сервера
+    WEBHOOK_URL: str = ""
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_SECRET: str = ""
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+
+    # Максимум одновременно обрабатываемых обновлений в режиме webhook
+    # и время на их завершение при остановке (в секундах)
+    WEBHOOK_MAX_UPDATES: int = 50
+    WEBHOOK_SHUTDOWN_TIMEOUT: float = 30
+    
     # Платёжный провайдер Telegram
     PRICE_RUB: float
     
@@ -25,6 +43,85 @@ class Settings(BaseSettings):
     # URL базы данных (например: sqlite+aiosqlite:///database.db)
     DATABASE_URL: str = "sqlite+aiosqlite:///database.db"
 
+    # Пул соединений с БД: постоянные соединения, дополнительные сверх них
+    # и время ожидания свободного соединения в секундах
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+
+    # Кэш file_id по ID платежа: размер LRU и время жизни записи в секундах
+    # (0 — без ограничения по времени)
+    FILE_ID_CACHE_SIZE: int = 10000
+    FILE_ID_CACHE_TTL: float = 3600
+
+    # Размер страницы при выборке заказов пользователя
+    PAYMENTS_PAGE_SIZE: int = 50
+
+    # Лимит отправки в один чат: запросов в секунду и размер запаса
+    DELIVERY_CHAT_RATE: float = 1.0
+    DELIVERY_CHAT_BURST: int = 3
+
+    # Количество процессов-воркеров для генерации отчетов
+    REPORT_WORKERS: int = 2
+
+    # Максимальная длина очереди заданий на генерацию
+    REPORT_QUEUE_SIZE: int = 32
+
+    # Максимум заданий генерации одного пользователя в пуле одновременно
+    # (0 — без ограничения)
+    REPORT_USER_CAP: int = 2
+
+    # Датасет (.csv или .parquet; для Parquet нужен pyarrow)
+    # и размер части при чтении в строках (0 — читать целиком)
+    DATASET_PATH: str = "data/ds_salaries.csv"
+    DATASET_CHUNK_ROWS: int = 500000
+
+    # Каталог для .npy-кэша матрицы признаков и статистики для корреляций
+    # (пусто — без кэша на диске)
+    DATASET_CACHE_DIR: str = "data/cache"
+
+    # Кэш PNG тепловых карт: число схем в памяти и каталог на диске
+    HEATMAP_CACHE_SIZE: int = 15
+    HEATMAP_CACHE_DIR: str = "data/cache/heatmaps"
+
+    # Кэш результатов моделей по (test_size, random_state):
+    # размер LRU в памяти и каталог для сохранения между перезапусками
+    # (хранится только текущая версия датасета, до ~90 МБ на движок)
+    MODEL_CACHE_SIZE: int = 512
+    MODEL_CACHE_DIR: str = "data/cache/models"
+
+    # Движок обучения моделей: sklearn, fast (NumPy + KD-дерево)
+    # или incremental (линейная модель по статистике датасета)
+    MODEL_ENGINE: Literal["sklearn", "fast", "incremental"] = "sklearn"
+
+    # Пакетная выдача администратору: одновременных генераций
+    # и предельный размер zip-архива в мегабайтах
+    ADMIN_BATCH_CONCURRENCY: int = 2
+    ADMIN_BATCH_ZIP_MB: int = 45
+
+    # Запас готовых отчетов: пополняется в простое, когда отчетов меньше
+    # нижней границы, до верхней границы (0 — без запаса)
+    STOCK_LOW_WATERMARK: int = 2
+    STOCK_HIGH_WATERMARK: int = 5
+
+    # Хранилище готовых отчетов по вариантам параметров: каталог
+    # (пусто — выключено) и предельный размер в мегабайтах
+    ARTIFACT_STORE_DIR: str = "data/cache/artifacts"
+    ARTIFACT_STORE_MAX_MB: int = 512
+
+    # Эндпоинт метрик Prometheus: адрес и порт (0 — метрики выключены)
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 0
+
+    # Очередь заданий на доставку отчетов: число одновременно выполняемых
+    # заданий, число попыток, интервал опроса БД, базовая задержка повтора
+    # и время, после которого задание в работе считается зависшим (в секундах)
+    JOBS_CONCURRENCY: int = 8
+    JOBS_MAX_ATTEMPTS: int = 5
+    JOBS_POLL_INTERVAL: float = 5
+    JOBS_RETRY_DELAY: float = 30
+    JOBS_STALE_AFTER: float = 120
+
     class Config(SettingsConfigDict):
         env_file = ".env"
         env_file_encoding = "utf-8"
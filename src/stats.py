@@ -0,0 +1,146 @@
+"""
+Инкрементальная статистика столбцов датасета: число строк, средние и ко-моменты.
+
+По ней без прохода по данным вычисляются матрица корреляций и нормальные
+уравнения линейной регрессии. Новые строки добавляются за O(новых строк),
+а статистику части строк (например, тестовой выборки) можно вычесть
+из общей. Объединение и вычитание идут по формулам Чана для центрированных
+моментов, что устойчивее сумм x и x² в исходном масштабе.
+"""
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class Moments:
+    """
+    Средние и матрица ко-моментов Σ(x - mean)(x - mean)ᵀ набора строк.
+
+    Атрибуты:
+        columns: Имена столбцов
+        count: Число строк
+        mean: Средние по столбцам
+        comoment: Матрица ко-моментов
+    """
+
+    def __init__(
+        self,
+        columns: Sequence[str],
+        count: int = 0,
+        mean: Optional[np.ndarray] = None,
+        comoment: Optional[np.ndarray] = None
+    ) -> None:
+        size = len(columns)
+        self.columns = list(columns)
+        self.count = int(count)
+        self.mean = np.zeros(size) if mean is None else np.asarray(mean, dtype=np.float64)
+        self.comoment = np.zeros((size, size)) if comoment is None else np.asarray(comoment, dtype=np.float64)
+
+    @classmethod
+    def from_array(cls, columns: Sequence[str], values: np.ndarray) -> "Moments":
+        """
+        Статистика строк матрицы values (столбцы в порядке columns).
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if not values.shape[0]:
+            return cls(columns)
+        mean = values.mean(axis=0)
+        centered = values - mean
+        return cls(columns, values.shape[0], mean, centered.T @ centered)
+
+    def _combine(self, other: "Moments", sign: int) -> "Moments":
+        if other.columns != self.columns:
+            raise ValueError("Столбцы статистик не совпадают")
+        count = self.count + sign * other.count
+        if count < 0:
+            raise ValueError("Вычитается больше строк, чем есть в статистике")
+        if not count:
+            return Moments(self.columns)
+        if not other.count:
+            return Moments(self.columns, self.count, self.mean.copy(), self.comoment.copy())
+
+        if sign > 0:
+            delta = other.mean - self.mean
+            mean = self.mean + delta * other.count / count
+            comoment = self.comoment + other.comoment + np.outer(delta, delta) * self.count * other.count / count
+        else:
+            # Обратная формула: self = result + other
+            mean = (self.mean * self.count - other.mean * other.count) / count
+            delta = other.mean - mean
+            comoment = self.comoment - other.comoment - np.outer(delta, delta) * count * other.count / self.count
+        return Moments(self.columns, count, mean, comoment)
+
+    def merge(self, other: "Moments") -> "Moments":
+        """
+        Статистика объединения двух наборов строк.
+        """
+        return self._combine(other, 1)
+
+    def subtract(self, other: "Moments") -> "Moments":
+        """
+        Статистика набора без строк other (other — его подмножество).
+        """
+        return self._combine(other, -1)
+
+    def update(self, values: np.ndarray) -> None:
+        """
+        Добавляет строки матрицы values на месте.
+        """
+        merged = self.merge(Moments.from_array(self.columns, values))
+        self.count, self.mean, self.comoment = merged.count, merged.mean, merged.comoment
+
+    def select(self, columns: Sequence[str]) -> "Moments":
+        """
+        Статистика подмножества столбцов.
+        """
+        index = [self.columns.index(column) for column in columns]
+        return Moments(columns, self.count, self.mean[index], self.comoment[np.ix_(index, index)])
+
+    def correlation(self) -> np.ndarray:
+        """
+        Матрица корреляций Пирсона (NaN для столбцов без разброса, как в pandas).
+        """
+        std = np.sqrt(np.diag(self.comoment))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.comoment / np.outer(std, std)
+
+    def solve(self, features: Sequence[str], target: str) -> Tuple[np.ndarray, float]:
+        """
+        Линейная регрессия target по features со свободным членом.
+
+        Нормальные уравнения XᵀX·coef = Xᵀy записаны для центрированных
+        данных, поэтому свободный член равен mean_y - mean_xᵀ·coef.
+
+        Возвращает:
+            Tuple[np.ndarray, float]: Коэффициенты и свободный член
+        """
+        x = [self.columns.index(column) for column in features]
+        y = self.columns.index(target)
+        xtx = self.comoment[np.ix_(x, x)]
+        xty = self.comoment[x, y]
+        # lstsq вместо solve: вырожденная XᵀX (постоянный признак) не падает
+        coef = np.linalg.lstsq(xtx, xty, rcond=None)[0]
+        return coef, float(self.mean[y] - self.mean[x] @ coef)
+
+    def to_dict(self) -> Dict[str, np.ndarray]:
+        """
+        Массивы для сохранения в .npz.
+        """
+        return {
+            'columns': np.asarray(self.columns),
+            'count': np.asarray(self.count),
+            'mean': self.mean,
+            'comoment': self.comoment,
+        }
+
+    @classmethod
+    def from_dict(cls, data) -> "Moments":
+        """
+        Статистика из массивов, сохраненных to_dict.
+        """
+        return cls(
+            [str(column) for column in data['columns']],
+            int(data['count']),
+            data['mean'],
+            data['comoment'],
+        )
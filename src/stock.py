@@ -0,0 +1,104 @@
+"""
+Запас заранее сгенерированных отчетов для мгновенной выдачи после оплаты.
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Optional
+
+from reports import get_project_document
+from settings import settings
+from workers import PRIORITY_BACKGROUND, report_pool
+
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед повторной проверкой, занят ли пул генерации
+IDLE_POLL_INTERVAL = 1.0
+
+# Пауза после ошибки генерации
+RETRY_INTERVAL = 10.0
+
+
+class ReportStock:
+    """
+    Запас уникальных отчетов, сгенерированных в фоне.
+
+    Когда в запасе остается меньше low отчетов, фоновая задача догенерирует
+    их до high, но только пока пул генерации не занят заказами пользователей.
+    Отчеты хранятся в памяти процесса.
+    """
+
+    def __init__(self, low: int, high: int) -> None:
+        self.low = max(0, low)
+        self.high = max(self.low, high)
+        self._documents: Deque[bytes] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    async def start(self) -> None:
+        """
+        Запускает фоновое пополнение запаса.
+        """
+        if self.high == 0 or self._task is not None:
+            return
+
+        self._wakeup.set()
+        self._task = asyncio.create_task(self._refill())
+
+    def take(self) -> Optional[bytes]:
+        """
+        Забирает готовый отчет из запаса.
+
+        Возвращает:
+            Optional[bytes]: Содержимое файла отчета или None, если запас пуст
+        """
+        document = self._documents.popleft() if self._documents else None
+        if len(self._documents) < self.low:
+            self._wakeup.set()
+        return document
+
+    async def _refill(self) -> None:
+        """
+        Фоновое пополнение запаса от нижней до верхней границы.
+        """
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            if self._documents and len(self._documents) >= self.low:
+                continue
+
+            while len(self._documents) < self.high:
+                # Генерируем только в простое, чтобы не задерживать покупателей
+                if report_pool.pending:
+                    await asyncio.sleep(IDLE_POLL_INTERVAL)
+                    continue
+
+                try:
+                    document = await get_project_document(PRIORITY_BACKGROUND)
+                except Exception:
+                    logger.exception("Не удалось пополнить запас отчетов")
+                    await asyncio.sleep(RETRY_INTERVAL)
+                    continue
+
+                self._documents.append(document)
+
+    async def close(self) -> None:
+        """
+        Останавливает фоновое пополнение.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+# Общий запас отчетов
+report_stock = ReportStock(
+    settings.STOCK_LOW_WATERMARK,
+    settings.STOCK_HIGH_WATERMARK,
+)
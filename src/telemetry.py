@@ -0,0 +1,317 @@
+"""
+Метрики бота и пайплайна в формате Prometheus.
+
+Метрики включаются настройкой METRICS_PORT и отдаются по HTTP на
+METRICS_HOST:METRICS_PORT/metrics. Когда они выключены, вызовы observe/inc/time
+сразу возвращаются, поэтому инструментирование почти ничего не стоит.
+"""
+import asyncio
+import contextlib
+import time
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from settings import settings
+
+
+# Метрики собираются только при заданном порту
+ENABLED = settings.METRICS_PORT > 0
+
+# Границы корзин гистограмм по умолчанию, в секундах
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_NULL_TIMER = contextlib.nullcontext()
+
+# Время на чтение запроса и отправку ответа сервером метрик, в секундах
+REQUEST_TIMEOUT = 10.0
+
+_registry: List["_Metric"] = []
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    """
+    Форматирует метки в виде {name="value",...}.
+    """
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    """
+    Базовый класс метрики: имя, описание, тип и имена меток.
+    """
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        lines.extend(self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """
+    Монотонно растущий счетчик.
+    """
+    type_name = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Gauge(_Metric):
+    """
+    Текущее значение, вычисляемое функцией в момент запроса метрик.
+
+    С метками функция возвращает словарь: значение метки (или кортеж
+    значений) -> значение метрики.
+    """
+    type_name = 'gauge'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        func: Callable[[], Any],
+        labelnames: Sequence[str] = ()
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._func = func
+
+    def samples(self) -> Iterator[str]:
+        if not self.labelnames:
+            yield f"{self.name} {self._func()}"
+            return
+        for key, value in self._func().items():
+            key = key if isinstance(key, tuple) else (key,)
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram(_Metric):
+    """
+    Гистограмма длительностей с накопительными корзинами.
+    """
+    type_name = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        counts[-1] += 1
+        self._sums[key] += value
+
+    def time(self, **labels: str) -> ContextManager:
+        """
+        Контекстный менеджер, измеряющий длительность блока.
+        """
+        if not ENABLED:
+            return _NULL_TIMER
+        return self._timer(labels)
+
+    @contextlib.contextmanager
+    def _timer(self, labels: Dict[str, str]) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[str]:
+        for key, counts in self._counts.items():
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                yield f"{self.name}_bucket{labels} {count}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {self._sums[key]}"
+            yield f"{self.name}_count{labels} {counts[-1]}"
+
+
+class StageClock:
+    """
+    Замер длительности последовательных этапов в процессе-воркере.
+
+    Каждый вызов mark(name) записывает время с предыдущей отметки;
+    словарь timings возвращается вместе с результатом задания.
+    """
+
+    def __init__(self) -> None:
+        self.timings: Dict[str, float] = {}
+        self._last = time.perf_counter()
+
+    def mark(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.timings[stage] = now - self._last
+        self._last = now
+
+
+def render_metrics() -> str:
+    """
+    Текст всех метрик в формате Prometheus.
+    """
+    return '\n'.join(metric.render() for metric in _registry) + '\n'
+
+
+# Пайплайн генерации
+REPORT_QUEUE_WAIT = Histogram(
+    'report_queue_wait_seconds',
+    "Время ожидания задания в очереди пула генерации",
+    labelnames=('priority',),
+)
+REPORT_GENERATION = Histogram(
+    'report_generation_seconds',
+    "Полное время выполнения задания в процессе-воркере",
+)
+REPORT_STAGE = Histogram(
+    'report_stage_seconds',
+    "Время этапов генерации отчета",
+    labelnames=('stage',),
+)
+
+# База данных и Telegram
+DB_QUERY = Histogram(
+    'db_query_seconds',
+    "Время запросов к базе данных",
+    labelnames=('query',),
+)
+TELEGRAM_UPLOAD = Histogram(
+    'telegram_upload_seconds',
+    "Время отправки документа в Telegram",
+    labelnames=('source',),
+)
+PAYMENT_DELIVERY = Histogram(
+    'payment_delivery_seconds',
+    "Время от постановки задания на доставку до отправки документа",
+)
+FILE_ID_CACHE = Counter(
+    'file_id_cache_requests_total',
+    "Обращения к кэшу file_id по результату",
+    labelnames=('result',),
+)
+FILE_ID_LRU = Counter(
+    'file_id_lru_requests_total',
+    "Поиски file_id в LRU-кэше процесса по результату",
+    labelnames=('result',),
+)
+ARTIFACT_LOOKUP = Counter(
+    'artifact_store_lookups_total',
+    "Поиски отчета варианта в хранилище по результату",
+    labelnames=('result',),
+)
+
+
+class _MetricsServer:
+    """
+    Минимальный HTTP-сервер, отдающий метрики по GET /metrics.
+    """
+
+    def __init__(self) -> None:
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            await asyncio.wait_for(self._respond(reader, writer), REQUEST_TIMEOUT)
+        except (asyncio.TimeoutError, OSError, ValueError):
+            # Клиент молчит, отключился или прислал слишком длинную строку
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(asyncio.TimeoutError, OSError):
+                await asyncio.wait_for(writer.wait_closed(), REQUEST_TIMEOUT)
+
+    async def _respond(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        request_line = await reader.readline()
+        # Заголовки запроса не нужны, но их надо дочитать
+        while (await reader.readline()).strip():
+            pass
+
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+            status, body = '200 OK', render_metrics().encode()
+        else:
+            status, body = '404 Not Found', b''
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+    async def start(self) -> None:
+        """
+        Запускает сервер метрик, если они включены.
+        """
+        if not ENABLED or self._server is not None:
+            return
+        self._server = await asyncio.start_server(
+            self._handle, settings.METRICS_HOST, settings.METRICS_PORT
+        )
+
+    async def close(self) -> None:
+        """
+        Останавливает сервер метрик.
+        """
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+
+def observe_stages(timings: Dict[str, float]) -> None:
+    """
+    Записывает длительности этапов, полученные от процесса-воркера.
+    """
+    if not ENABLED:
+        return
+    for stage, seconds in timings.items():
+        REPORT_STAGE.observe(seconds, stage=stage)
+
+
+metrics_server = _MetricsServer()
@@ -0,0 +1,92 @@
+"""
+Шаблон отчета: однократный разбор DOCX и индекс плейсхолдеров.
+"""
+import copy
+import functools
+import re
+from typing import BinaryIO, Dict, List
+
+from docx import Document
+from docx.document import Document as DocumentObject
+from docx.shared import Inches
+
+
+# Путь к DOCX-шаблону отчета
+TEMPLATE_PATH = 'data/project.docx'
+
+# Плейсхолдер вида {{NAME}}
+PLACEHOLDER_PATTERN = re.compile(r'\{\{[A-Z0-9_]+\}\}')
+
+
+class ReportTemplate:
+    """
+    Разобранный шаблон отчета с индексом плейсхолдеров.
+
+    Шаблон читается с диска один раз; для каждого отчета создается копия
+    XML-дерева, а индекс "плейсхолдер -> номера абзацев" строится при загрузке,
+    поэтому все подстановки выполняются за один проход по нужным абзацам.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._document = Document(path)
+        self.index: Dict[str, List[int]] = {}
+        for position, paragraph in enumerate(self._document.paragraphs):
+            for placeholder in PLACEHOLDER_PATTERN.findall(paragraph.text):
+                positions = self.index.setdefault(placeholder, [])
+                if position not in positions:
+                    positions.append(position)
+
+    def new_document(self) -> DocumentObject:
+        """
+        Возвращает независимую копию нетронутого шаблона.
+
+        Копируется часть документа вместе с пакетом: документ строится заново
+        от скопированной части, чтобы правки и сохранение шли в одно XML-дерево.
+        """
+        return copy.deepcopy(self._document.part).document
+
+    def fill(
+        self,
+        doc: DocumentObject,
+        texts: Dict[str, str],
+        images: Dict[str, BinaryIO]
+    ) -> None:
+        """
+        Подстановка текстов и изображений на место плейсхолдеров.
+
+        Аргументы:
+            doc: Копия шаблона, полученная из new_document
+            texts: Плейсхолдер -> текст для замены
+            images: Плейсхолдер -> поток с изображением
+        """
+        targets: Dict[int, List[str]] = {}
+        for placeholder in (*texts, *images):
+            for position in self.index.get(placeholder, ()):
+                targets.setdefault(position, []).append(placeholder)
+
+        paragraphs = doc.paragraphs
+        for position in sorted(targets):
+            paragraph = paragraphs[position]
+            text = paragraph.text
+            for placeholder in targets[position]:
+                text = text.replace(placeholder, texts.get(placeholder, ''))
+            paragraph.text = text
+
+            for placeholder in targets[position]:
+                if placeholder in images:
+                    run = paragraph.add_run()
+                    run.add_picture(images[placeholder], width=Inches(7))
+
+
+@functools.lru_cache(maxsize=None)
+def get_template(path: str = TEMPLATE_PATH) -> ReportTemplate:
+    """
+    Возвращает шаблон отчета, разбирая файл при первом обращении.
+
+    Аргументы:
+        path: Путь к DOCX-шаблону
+
+    Возвращает:
+        ReportTemplate: Разобранный шаблон с индексом плейсхолдеров
+    """
+    return ReportTemplate(path)
@@ -4,25 +4,28 @@
 from aiogram import Router, F
 from aiogram.types import (
     Message,
-    FSInputFile,
+    BufferedInputFile,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
     CallbackQuery,
     LabeledPrice,
     PreCheckoutQuery,
 )
-import os
-import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 import json
 
-from backend import get_filepath_project
-from models import async_session, Payment
+from artifacts import artifact_store
+from delivery import deliver_payments, get_payment_document
+from jobs import report_jobs
+from workers import PRIORITY_RESEND
 from settings import settings
+from telemetry import FILE_ID_CACHE, TELEGRAM_UPLOAD
 from payments import (
+    add_payment,
     get_price_rub,
     set_file_id_for_provider,
-    get_file_id_for_provider,
-    list_successful_payments,
+    iter_successful_payments,
 )
 
 
@@ -69,45 +72,57 @@ async def handle_start(message: Message) -> None:
     )
 
 
-async def send_project_file(
+async def deliver_project_file(
     message: Message,
+    session: AsyncSession,
     provider_payment_id: str,
     receipt_text: str,
+    cached_file_id: Optional[str],
+    priority: int = PRIORITY_RESEND,
 ) -> bool:
     """
-    Отправляет файл проекта пользователю
+    Отправляет файл проекта по уже известному file_id платежа, а если его
+    нет — генерирует отчет, отправляет и привязывает file_id к платежу
     
     Args:
         message: Объект сообщения, в чат которого отправится файл
-        payment_id: ID платежа
+        session: Сессия БД текущего обновления
+        provider_payment_id: ID платежа
         receipt_text: Текст чека
+        cached_file_id: file_id из уже прочитанной записи платежа
+        priority: Класс приоритета генерации в пуле
         
     Returns:
         bool: Успешность отправки
     """
-    cached_file_id = await get_file_id_for_provider(provider_payment_id)
     if cached_file_id:
-        await message.answer_document(cached_file_id, caption=receipt_text)
+        FILE_ID_CACHE.inc(result="hit")
+        with TELEGRAM_UPLOAD.time(source="file_id"):
+            await message.answer_document(cached_file_id, caption=receipt_text)
         return True
+    FILE_ID_CACHE.inc(result="miss")
     
+    # Завершаем транзакцию чтения, чтобы не держать соединение во время генерации
+    await session.commit()
+    
+    document = None
     try:
-        file_path = await get_filepath_project()
+        # Отчет из запаса или новый; одновременные запросы по платежу ждут одну генерацию
+        document = await get_payment_document(provider_payment_id, priority, owner=message.chat.id)
         safe_payment_id = provider_payment_id or "proj"
-        docx = FSInputFile(file_path, filename=f"{safe_payment_id}.docx")
-        sent_message = await message.answer_document(docx, caption=receipt_text)
-        
-        # Очистка временного файла
-        try:
-            os.remove(file_path)
-        except OSError:
-            pass
+        docx = BufferedInputFile(document, filename=f"{safe_payment_id}.docx")
+        with TELEGRAM_UPLOAD.time(source="upload"):
+            sent_message = await message.answer_document(docx, caption=receipt_text)
         
         # Сохранение file_id для будущего использования
         file_id = sent_message.document.file_id
-        await set_file_id_for_provider(provider_payment_id, file_id)
+        artifact_store.mark_used(document)
+        await set_file_id_for_provider(session, provider_payment_id, file_id)
         return True
         
     except Exception as e:
+        if document is not None:
+            artifact_store.release(document)
         await message.answer(f"❌ Ошибка при отправке файла: {str(e)}")
         return False
 
@@ -150,27 +165,25 @@ async def handle_pay_invoice(cb: CallbackQuery) -> None:
 
 
 @router_user.callback_query(F.data == "get_all_projects")
-async def handle_get_all_projects(cb: CallbackQuery) -> None:
+async def handle_get_all_projects(cb: CallbackQuery, session: AsyncSession) -> None:
     """
     Обработчик проверки всех платежей
     
     Args:
         cb: CallbackQuery объект
+        session: Сессия БД текущего обновления
     """
     await cb.answer()
     
-    # Берем только успешные платежи пользователя
-    payments = await list_successful_payments(cb.from_user.id)
-
-    if not payments:
+    # Заказы читаются страницами по индексу (user_id, id), а не целиком
+    found = False
+    async for payments in iter_successful_payments(session, cb.from_user.id):
+        found = True
+        # Пакетная отправка с лимитом по чату и генерацией недостающих отчетов
+        await deliver_payments(cb.message, session, payments)
+
+    if not found:
         await cb.message.answer("У вас нет завершенных платежей.")
-        return
-
-    for payment in payments:
-        provider_payment_id = payment["provider_payment_id"]
-        receipt_text = f"ID платежа: {provider_payment_id}"
-        await send_project_file(cb.message, provider_payment_id, receipt_text)
-        await asyncio.sleep(0.5)
 
 
 @router_user.pre_checkout_query()
@@ -179,24 +192,22 @@ async def handle_pre_checkout(pre_checkout_query: PreCheckoutQuery) -> None:
 
 
 @router_user.message(F.successful_payment)
-async def handle_successful_payment(message: Message) -> None:
+async def handle_successful_payment(message: Message, session: AsyncSession) -> None:
     sp = message.successful_payment
     provider_payment_id = sp.provider_payment_charge_id
 
-    # Сохраняем успешный платеж
-    async with async_session() as session:
-        session.add(
-            Payment(
-                user_id=message.from_user.id,
-                username=message.from_user.username,
-                provider_payment_id=provider_payment_id,
-            )
-        )
-        await session.commit()
+    # Сохраняем успешный платеж; повторная доставка того же обновления не создает дубликат
+    await add_payment(
+        session,
+        user_id=message.from_user.id,
+        username=message.from_user.username,
+        provider_payment_id=provider_payment_id,
+    )
 
     amount_rub = sp.total_amount / 100
     receipt_text = (
         f"Сумма: {amount_rub:.2f} ₽\n"
         f"ID банка: {provider_payment_id}\n"
     )
-    await send_project_file(message, provider_payment_id, receipt_text)
\ No newline at end of file
+    # Генерация и отправка выполняются воркером заданий; задание одно на платеж
+    await report_jobs.enqueue(session, provider_payment_id, message.chat.id, receipt_text)
\ No newline at end of file
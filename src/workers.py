@@ -0,0 +1,290 @@
+"""
+Пул процессов для генерации отчетов с ограниченной очередью заданий.
+
+Очередь приоритетная: сначала выполняются отчеты для новых оплат, затем
+повторные выдачи, затем фоновые задания (админская генерация, запас).
+Внутри класса порядок FIFO, а один пользователь одновременно занимает
+в пуле не больше REPORT_USER_CAP заданий. Если процесс-воркер аварийно
+завершается, пул процессов пересоздается.
+"""
+import asyncio
+import contextlib
+import importlib
+import itertools
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional, Union
+
+import telemetry
+from settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Классы приоритета заданий (меньше — раньше)
+PRIORITY_FRESH = 0
+PRIORITY_RESEND = 1
+PRIORITY_BACKGROUND = 2
+
+# Имена классов для метрик
+PRIORITY_NAMES = {
+    PRIORITY_FRESH: "fresh",
+    PRIORITY_RESEND: "resend",
+    PRIORITY_BACKGROUND: "background",
+}
+
+
+def _init_worker() -> None:
+    """
+    Инициализация процесса-воркера.
+
+    Заранее импортирует backend, готовит датасет и разбирает шаблон, чтобы
+    matplotlib/sklearn/docx и данные загружались один раз при старте процесса,
+    а не при первом задании.
+    """
+    import backend  # noqa: F401
+    from dataset import get_dataset
+    from template import get_template
+
+    get_dataset()
+    get_template()
+
+
+def _call_by_name(name: str, *args: Any) -> Any:
+    """
+    Вызов функции по имени "модуль:функция" в процессе-воркере.
+
+    Позволяет ставить задания, не импортируя модуль функции
+    в процессе бота.
+    """
+    module_name, _, func_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), func_name)(*args)
+
+
+class ReportPool:
+    """
+    Пул процессов-воркеров для генерации отчетов.
+
+    Каждый процесс владеет собственным состоянием matplotlib/sklearn/docx,
+    поэтому отчеты генерируются параллельно. Задания попадают в приоритетную
+    очередь ограниченного размера: при ее заполнении вызывающий ждет
+    свободного места. Задания одного владельца сверх user_cap ждут
+    до постановки в очередь и не занимают в ней место.
+    """
+
+    def __init__(self, workers: int, queue_size: int, user_cap: int = 0) -> None:
+        self._workers = max(1, workers)
+        self._queue_size = max(1, queue_size)
+        self._user_cap = max(0, user_cap)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._consumers: List[asyncio.Task] = []
+        self._pending = 0
+        self._sequence = itertools.count()
+        # Заданий в очереди по классам приоритета
+        self._queued = dict.fromkeys(PRIORITY_NAMES, 0)
+        # Слоты владельцев: owner -> [семафор, число заданий владельца]
+        self._owners: Dict[Hashable, list] = {}
+
+    @property
+    def workers(self) -> int:
+        """
+        Количество процессов-воркеров.
+        """
+        return self._workers
+
+    @property
+    def pending(self) -> int:
+        """
+        Количество заданий в очереди и в работе.
+        """
+        return self._pending
+
+    def queued(self) -> Dict[str, int]:
+        """
+        Количество заданий в очереди по классам приоритета.
+        """
+        return {PRIORITY_NAMES[priority]: count for priority, count in self._queued.items()}
+
+    @property
+    def capped(self) -> int:
+        """
+        Количество заданий, ждущих из-за ограничения на владельца.
+        """
+        return sum(max(0, users - self._user_cap) for _, users in self._owners.values())
+
+    def _ensure_started(self) -> None:
+        """
+        Ленивый запуск процессов и потребителей очереди.
+        """
+        if self._executor is not None:
+            return
+
+        self._executor = self._create_executor()
+        self._queue = asyncio.PriorityQueue(maxsize=self._queue_size)
+        self._consumers = [
+            asyncio.create_task(self._consume())
+            for _ in range(self._workers)
+        ]
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self._workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+    def _replace_executor(self, broken: ProcessPoolExecutor) -> None:
+        """
+        Заменяет сломанный пул процессов новым.
+
+        Сломанный пул видят все потребители с заданиями в работе, но
+        пересоздает его только первый: остальные застанут уже новый.
+        """
+        if self._executor is not broken:
+            return
+        logger.error("Процесс-воркер аварийно завершился, пул процессов пересоздается")
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._create_executor()
+
+    async def _execute(self, func: Callable[..., Any], args: tuple) -> Any:
+        """
+        Выполняет задание в пуле процессов.
+
+        Когда процесс-воркер аварийно завершается (OOM, segfault),
+        ProcessPoolExecutor ломается навсегда: пул пересоздается, а задание
+        повторяется один раз. Повторное падение пробрасывается вызывающему,
+        чтобы задание, которое само роняет процесс, не перезапускало пул
+        бесконечно.
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in itertools.count():
+            executor = self._executor
+            try:
+                return await loop.run_in_executor(executor, func, *args)
+            except BrokenProcessPool:
+                self._replace_executor(executor)
+                if attempt:
+                    raise
+
+    async def _consume(self) -> None:
+        """
+        Забирает задания из очереди и выполняет их в пуле процессов.
+        """
+        while True:
+            priority, _, func, args, future, enqueued = await self._queue.get()
+            self._queued[priority] -= 1
+            try:
+                if future.cancelled():
+                    continue
+                started = time.perf_counter()
+                telemetry.REPORT_QUEUE_WAIT.observe(started - enqueued, priority=PRIORITY_NAMES[priority])
+                try:
+                    result = await self._execute(func, args)
+                    telemetry.REPORT_GENERATION.observe(time.perf_counter() - started)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+            finally:
+                self._queue.task_done()
+
+    async def run(
+        self,
+        func: Union[Callable[..., Any], str],
+        *args: Any,
+        priority: int = PRIORITY_FRESH,
+        owner: Optional[Hashable] = None
+    ) -> Any:
+        """
+        Ставит задание в очередь и ожидает его результат.
+
+        Аргументы:
+            func: Функция верхнего уровня модуля (должна сериализоваться pickle)
+                или ее имя в виде "модуль:функция"
+            args: Аргументы функции
+            priority: Класс приоритета (PRIORITY_FRESH, PRIORITY_RESEND,
+                PRIORITY_BACKGROUND)
+            owner: Владелец задания (например, ID пользователя) для
+                ограничения числа его заданий в пуле
+
+        Возвращает:
+            Any: Результат выполнения функции в процессе-воркере
+        """
+        if isinstance(func, str):
+            func, args = _call_by_name, (func, *args)
+
+        async with self._owner_slot(owner):
+            self._ensure_started()
+            future = asyncio.get_running_loop().create_future()
+            self._pending += 1
+            try:
+                await self._queue.put((priority, next(self._sequence), func, args, future, time.perf_counter()))
+                self._queued[priority] += 1
+                return await future
+            finally:
+                self._pending -= 1
+
+    @contextlib.asynccontextmanager
+    async def _owner_slot(self, owner: Optional[Hashable]) -> AsyncIterator[None]:
+        """
+        Ограничивает число одновременных заданий владельца в пуле.
+        """
+        if owner is None or not self._user_cap:
+            yield
+            return
+
+        slot = self._owners.get(owner)
+        if slot is None:
+            slot = self._owners[owner] = [asyncio.Semaphore(self._user_cap), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if not slot[1]:
+                del self._owners[owner]
+
+    async def close(self) -> None:
+        """
+        Останавливает потребителей очереди и завершает процессы пула.
+        """
+        if self._executor is None:
+            return
+
+        for task in self._consumers:
+            task.cancel()
+        await asyncio.gather(*self._consumers, return_exceptions=True)
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._executor.shutdown)
+        self._executor = None
+        self._queue = None
+        self._consumers = []
+
+
+# Общий пул генерации отчетов
+report_pool = ReportPool(settings.REPORT_WORKERS, settings.REPORT_QUEUE_SIZE, settings.REPORT_USER_CAP)
+
+telemetry.Gauge(
+    'report_pool_pending',
+    "Заданий генерации в очереди и в работе",
+    lambda: report_pool.pending,
+)
+telemetry.Gauge(
+    'report_pool_queued',
+    "Заданий генерации в очереди по классам приоритета",
+    report_pool.queued,
+    labelnames=('priority',),
+)
+telemetry.Gauge(
+    'report_pool_capped',
+    "Заданий, ждущих из-за ограничения на пользователя",
+    lambda: report_pool.capped,
+)